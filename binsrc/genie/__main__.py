@@ -3,18 +3,16 @@
 import argparse
 import fcntl
 import os
-import subprocess
+import signal
 import sys
 import time
 
-import nsenter
-
-import apparmor
-import binfmts
+# Modules needed only by particular commands are imported by the functions
+# which use them, to keep startup fast for the others.
+import bottle
 import configuration
+import facts
 import helpers
-import host
-import resolved
 
 # Global variables
 version = "2.5"
@@ -22,15 +20,21 @@ version = "2.5"
 verbose = False
 login = None
 
+# When the genie being served started, in seconds after boot, if not this process.
+client_start_time = None
+
 lockfile_fp = None
 
+# Environment for systemd and user managers, in environment.d(5) format.
+environment_file = '/run/environment.d/80-genie.conf'
+
 
 # Init lock functions
 def bottle_init_lock():
     """Lock the bottle init process to one instance only."""
     global lockfile_fp
 
-    lockfile_fp = open('/run/genie.init.lock', 'a')
+    lockfile_fp = open('/run/genie.init.lock', 'a+')
 
     try:
         fcntl.lockf(lockfile_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -40,18 +44,55 @@ def bottle_init_lock():
         lockfile_fp.flush()
         running = False
     except IOError:
-        with open('/run/genie.init.lock', 'r') as fp:
-            running = fp.read()
+        # The holder may not have written its pid yet; the lock is held all the same.
+        lockfile_fp.seek(0)
+        running = lockfile_fp.readline().strip() or True
 
     return running
 
 
-def bottle_init_unlock():
-    """Unlock the bottle init process."""
+def bottle_init_unlock(status):
+    """Unlock the bottle init process, leaving its exit status for any waiters."""
+    lockfile_fp.seek(0)
+    lockfile_fp.truncate()
+    lockfile_fp.write(f"{os.getpid()}\n{status}\n")
+    lockfile_fp.flush()
+
+    # Remove the lock file before releasing it; waiters already hold it open,
+    # and anyone arriving later should not find a stale one.
+    os.remove("/run/genie.init.lock")
+
     fcntl.lockf(lockfile_fp, fcntl.LOCK_UN)
     lockfile_fp.close()
 
-    os.remove("/run/genie.init.lock")
+
+def bottle_init_wait(timeout):
+    """Block until the bottle init process releases its lock; returns its exit status, or None on timeout."""
+    def alarm_handler(signum, frame):
+        raise TimeoutError()
+
+    previous_handler = signal.signal(signal.SIGALRM, alarm_handler)
+    signal.alarm(max(1, int(timeout)))
+
+    try:
+        fcntl.lockf(lockfile_fp, fcntl.LOCK_SH)
+    except TimeoutError:
+        return None
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+    lockfile_fp.seek(0)
+    lines = lockfile_fp.read().split('\n')
+
+    fcntl.lockf(lockfile_fp, fcntl.LOCK_UN)
+    lockfile_fp.close()
+
+    # If the init process died without recording a status, it failed.
+    if len(lines) < 2 or not lines[1].strip():
+        return 1
+
+    return int(lines[1])
 
 
 # Command line parser
@@ -69,10 +110,42 @@ def parse_command_line():
     parser.add_argument('-v', '--verbose', action='store_true',
                         help="display verbose progress messages")
 
+    # Trace option
+    parser.add_argument('--trace', action='store_true',
+                        help="display a waterfall of the time taken by each step on stderr")
+
     # Specify username option
     parser.add_argument('-a', '--as-user', action='store',
                         help="specify user to run shell or command as (use with -s or -c)", dest='user')
 
+    # Direct command option
+    parser.add_argument('-d', '--direct', action='store_true',
+                        help="run command directly in the bottle's namespaces, without a machinectl session (use with -c)")
+
+    # Pipe command option
+    parser.add_argument('-p', '--pipe', action='store_true',
+                        help="run command in a session without a pseudo-terminal, keeping its standard streams separate (use with -c)")
+
+    # Batch options
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help="run up to N commands at once (use with --batch)")
+    parser.add_argument('--batch-output', choices=['prefix', 'collect'], default='prefix',
+                        help="prefix each line of output with its command's number, or collect each command's output (use with --batch)")
+
+    # JSON output option
+    parser.add_argument('--json', action='store_true',
+                        help="display status as JSON (use with --status)")
+
+    # Dry run option
+    parser.add_argument('--dry-run', action='store_true',
+                        help="show the bottle initialization plan, without carrying it out (use with -i)")
+
+    # Detached initialization options
+    parser.add_argument('--detach', action='store_true',
+                        help="initialize the bottle in the background, returning at once (use with -i)")
+    parser.add_argument('--ready-fd', type=int, metavar='FD',
+                        help="write the bottle's state to FD, and close it, once initialized (use with -i)")
+
     # Commands
     group2 = parser.add_argument_group('commands')
     group = group2.add_mutually_exclusive_group(required=True)
@@ -85,12 +158,18 @@ def parse_command_line():
                        help='initialize the bottle (if necessary), and open a logon prompt in it')
     group.add_argument(
         '-c', '--command', help='initialize the bottle (if necessary), and run the specified command in it\n(preserves working directory)', nargs=argparse.REMAINDER)
+    group.add_argument('--batch', action='store_true',
+                       help='initialize the bottle (if necessary), and run the commands read from standard input in it')
     group.add_argument('-u', '--shutdown', action='store_true',
                        help='shut down systemd and exit the bottle')
     group.add_argument('-r', '--is-running', action='store_true',
                        help='check whether systemd is running in genie, or not')
     group.add_argument('-b', '--is-in-bottle', action='store_true',
                        help='check whether currently executing within the bottle, or not')
+    group.add_argument('--status', action='store_true',
+                       help='display the status of the bottle, all at once')
+    group.add_argument('--metrics', nargs='?', const='-', metavar='PATH',
+                       help="display genie's metrics in Prometheus text format, or write them to PATH")
 
     group.add_argument('-%', '--parser-test',
                        action='store_true', help=argparse.SUPPRESS)
@@ -101,58 +180,59 @@ def parse_command_line():
 # Subordinate functions.
 def pre_systemd_action_checks(sdp):
     """Things to check before performing a systemd-requiring action."""
+    import spans
 
-    if sdp == 0:
-        # no bottle exists; this means we should recurse and start one
-        initcommand = ["genie", "-i"]
-
-        if verbose:
-            initcommand.append("-v")
+    with spans.span('checks'):
+        if sdp == 0:
+            # no bottle exists; this means we should start one, right here, or
+            # if another genie is already starting one, wait for it and share
+            # its result.
+            with spans.span('checks.initialize'):
+                initialize_bottle(exists_ok=True)
 
-        init = subprocess.run(initcommand)
+            # Refresh systemd pid
+            sdp = helpers.find_systemd()
 
-        # continue when subprocess done
-        if init.returncode != 0:
-            sys.exit(
-                f"could not initialise bottle, exit code = {init.returncode}")
-
-        # Refresh systemd pid
-        sdp = helpers.find_systemd()
+        state = helpers.get_systemd_state(sdp)
 
-    state = helpers.get_systemd_state(sdp)
+        if 'stopping' in state:
+            sys.exit("genie: systemd is shutting down, cannot proceed")
 
-    if 'stopping' in state:
-        sys.exit("genie: systemd is shutting down, cannot proceed")
+        if 'initializing' in state or 'starting' in state:
+            # wait for it
+            print("genie: systemd is starting up, please wait...", end="", flush=True)
 
-    if 'initializing' in state or 'starting' in state:
-        # wait for it
-        print("genie: systemd is starting up, please wait...", end="", flush=True)
+            timeout = configuration.system_timeout()
 
-        timeout = configuration.system_timeout()
+            with spans.span('checks.wait-running'):
+                while ('running' not in state) and timeout > 0:
+                    time.sleep(1)
+                    state = helpers.get_systemd_state(sdp)
 
-        while ('running' not in state) and timeout > 0:
-            time.sleep(1)
-            state = helpers.get_systemd_state(sdp)
+                    print(".", end="", flush=True)
 
-            print(".", end="", flush=True)
+                timeout -= 1
 
-        timeout -= 1
+            print("")
 
-        print("")
+            if timeout <= 0:
+                print("genie: WARNING: timeout waiting for bottle to start")
 
-        if timeout <= 0:
-            print("genie: WARNING: timeout waiting for bottle to start")
+        if 'degraded' in state:
+            failed = helpers.get_systemd_failed_units_count(sdp)
 
-    if 'degraded' in state:
-        print('genie: WARNING: systemd is in degraded state, issues may occur!')
+            if failed is not None:
+                print(f'genie: WARNING: systemd is in degraded state ({failed} failed units), issues may occur!')
+            else:
+                print('genie: WARNING: systemd is in degraded state, issues may occur!')
 
-    if not ('running' in state or 'degraded' in state):
-        sys.exit("genie: systemd in unsupported state '"
-                 + state + "'; cannot proceed")
+        if not ('running' in state or 'degraded' in state):
+            sys.exit("genie: systemd in unsupported state '"
+                     + state + "'; cannot proceed")
 
 
 def set_secure_path():
-    """Set up secure path, saving original if specified."""
+    """Set up secure path, saving original if specified; returns the original path."""
     # Default original path.
     # TODO: Should reference system drive by letter
     originalPath = '/mnt/c/Windows/System32'
@@ -168,23 +248,94 @@ def set_secure_path():
         print(originalPath, file=pathfile)
         pathfile.close()
 
+    return originalPath
+
 
-def stash_environment():
+def stash_environment(original_path):
     """Save a copy of the original environment (specified variables only)."""
     # Get variables to stash
     names = configuration.clonable_envars()
 
+    # Start with the flag variable that's always added.
+    stashed = {'INSIDE_GENIE': 'yes'}
+
+    for n in names:
+        if n in os.environ:
+            stashed[n] = os.environ[n]
+
     # Do the stashing.
     with open('/run/genie.env', 'w') as envfile:
+        for n, value in stashed.items():
+            print(f"{n}={value}", file=envfile)
 
-        # Start with the flag variable that's always added.
-        print("INSIDE_GENIE=yes", file=envfile)
+        envfile.close()
 
-        for n in names:
-            if n in os.environ:
-                print(f"{n}={os.environ[n]}", file=envfile)
+    # Also write out the environment for systemd itself, and the user managers it
+    # starts, to pick up, ready-made: the stashed variables, plus the secure path
+    # and the original path, less duplicates.
+    paths = configuration.secure_path().split(':') + original_path.split(':')
+    stashed['PATH'] = ':'.join(dict.fromkeys(p for p in paths if p))
 
-        envfile.close()
+    os.makedirs(os.path.dirname(environment_file), exist_ok=True)
+
+    with open(environment_file, 'w') as envfile:
+        print("# Generated by genie when the bottle was initialized; do not edit.", file=envfile)
+
+        for n, value in stashed.items():
+            # Escape anything environment.d would otherwise expand or unquote.
+            value = ''.join('\\' + c if c in '\\$"\'' else c for c in value)
+            print(f"{n}={value}", file=envfile)
+
+
+def wait_for_systemd_notify(notify_sock):
+    """Wait for systemd to report readiness on the notification socket; returns its pid and state."""
+    import notify
+
+    sdp = notify.wait_ready(notify_sock, configuration.system_timeout(),
+                            lambda status: print("!", end="", flush=True))
+
+    if sdp == 0:
+        # No readiness notification; find out where things stand.
+        sdp = helpers.find_systemd()
+
+        if sdp == 0:
+            print("")
+            sys.exit(
+                f"genie: systemd did not start after {configuration.system_timeout()} seconds")
+
+    # Register the bottle, so that later invocations need not search for it.
+    bottle.record(sdp)
+
+    return sdp, helpers.get_systemd_state(sdp)
+
+
+def wait_for_systemd_polling():
+    """Wait for systemd to start and enter running state by polling; returns its pid and state."""
+    # Wait for systemd to be up (polling, sigh.)
+    sdp = 0
+
+    while sdp == 0:
+        time.sleep(0.5)
+        sdp = helpers.find_systemd()
+
+        print(".", end="", flush=True)
+
+    # Register the bottle, so that later invocations need not search for it.
+    bottle.record(sdp)
+
+    # Wait for systemd to be in running state.
+    state = 'initializing'
+    timeout = configuration.system_timeout()
+
+    while ('running' not in state and 'degraded' not in state) and timeout > 0:
+        time.sleep(1)
+        state = helpers.get_systemd_state(sdp)
+
+        print("!", end="", flush=True)
+
+        timeout -= 1
+
+    return sdp, state
 
 
 # Commands
@@ -196,24 +347,16 @@ def do_parser_test(arguments):
 
 
 # Initialize bottle
-def inner_do_initialize():
-    """Initialize the genie bottle (inner function)."""
-    sdp = helpers.find_systemd()
-
-    if sdp != 0:
-        sys.exit("genie: bottle is already established (systemd running)")
-
-    # FIRST: As a first step in initing systemd, delete any old runtime pid file
-    # if such exists.
-    if os.path.exists('/run/genie.systemd.pid'):
-        os.remove('/run/genie.systemd.pid')
-
-    # Set secure path, and stash original environment.
-    set_secure_path()
-    stash_environment()
-
-    # Check and warn if not multi-user.target.
-    if configuration.target_warning():
+def init_phases():
+    """Define the bottle initialization phases, as (name, function, dependencies)."""
+    import apparmor
+    import binfmts
+    import cgroup
+    import host
+    import resolved
+
+    def check_target(results):
+        """Check and warn if not multi-user.target."""
         target = helpers.get_systemd_target()
 
         if target != 'multi-user.target':
@@ -222,40 +365,85 @@ def inner_do_initialize():
             print("genie: WARNING: if you wish to use a different target, this warning can be disabled in the config file")
             print("genie: WARNING: if you experience problems, please change the target to multi-user.target")
 
+    # Set secure path, and stash original environment. Anything which runs other
+    # programs must wait for the secure path.
+    phases = [('secure-path', lambda results: set_secure_path(), []),
+              ('environment', lambda results: stash_environment(results['secure-path']), ['secure-path'])]
+
+    if configuration.target_warning():
+        phases.append(('target-check', check_target, []))
+
     # Now that the WSL hostname can be set via .wslconfig, we're going to make changing
     # it automatically in genie an option, enable/disable in genie.ini. Defaults to on
     # for backwards compatibility and because not doing so when using bridged networking is
     # a Bad Idea.
     if configuration.update_hostname():
-        host.update(verbose)
+        phases.append(('hostname', lambda results: host.update(verbose), ['secure-path']))
 
     # If configured to, create the resolv.conf symlink for systemd-resolved.
     if configuration.resolved_stub():
-        resolved.configure(verbose)
+        phases.append(('resolved', lambda results: resolved.configure(verbose), []))
+
+    # Update binfmts config file, then unmount the binfmts fs before starting
+    # systemd, so systemd can mount it again with all the trimmings.
+    phases.append(('binfmts-check',
+                   lambda results: facts.get('binfmt-flags', lambda: binfmts.check_flags(verbose)), []))
+    phases.append(('binfmts-write',
+                   lambda results: binfmts.write_interop_file(verbose, results['binfmts-check']),
+                   ['binfmts-check']))
+    phases.append(('binfmts-umount', lambda results: binfmts.umount(verbose),
+                   ['binfmts-write', 'secure-path']))
+
+    # If AppArmor is available in the kernel, configure an AppArmor namespace.
+    if apparmor.exists():
+        phases.append(('apparmor', lambda results: apparmor.configure(verbose), ['secure-path']))
 
-    # Update binfmts config file.
-    flags = binfmts.check_flags(verbose)
-    binfmts.write_interop_file(verbose, flags)
+    # If resource limits are configured, create a cgroup for the bottle to apply them.
+    if cgroup.configured():
+        phases.append(('cgroup', lambda results: cgroup.create(verbose), []))
 
-    # Unmount the binfmts fs before starting systemd, so systemd can mount it
-    # again with all the trimmings.
-    binfmts.umount(verbose)
+    return phases
 
-    # Define systemd startup chain.
-    startupChain = ["daemonize", helpers.get_unshare_path(), "-fp", "--propagation", "shared", "--mount-proc", "--"]
 
-    # Check whether AppArmor is available in the kernel.
-    if apparmor.exists():
+def inner_do_initialize():
+    """Initialize the genie bottle (inner function)."""
+    import subprocess
 
-        # If so, configure AppArmor.
-        nsName = apparmor.configure(verbose)
+    import metrics
+    import namespaces
+    import notify
+    import phases
+    import spans
 
-        # Add AppArmor to the startup chain.
-        if nsName is not None:
-            startupChain = startupChain + \
-                ["aa-exec", "-n", nsName, "-p", "unconfined", "--"]
+    sdp = helpers.find_systemd()
 
-    else:
+    if sdp != 0:
+        sys.exit("genie: bottle is already established (systemd running)")
+
+    # FIRST: As a first step in initing systemd, delete any old runtime pid file
+    # if such exists.
+    if os.path.exists('/run/genie.systemd.pid'):
+        os.remove('/run/genie.systemd.pid')
+
+    bottle.forget()
+
+    # Prepare the bottle, running independent phases concurrently.
+    with spans.span('initialize.phases'):
+        results, durations = phases.run(init_phases(), verbose)
+
+    metrics.record(observations=[('genie_init_phase_duration_seconds', {'phase': name}, elapsed)
+                                 for name, elapsed in durations.items()])
+
+    # Define systemd startup chain.
+    startupChain = ["daemonize", helpers.get_unshare_path(), "-fp", "--propagation", "shared", "--mount-proc", "--"]
+
+    # Add AppArmor to the startup chain, if we have an AppArmor namespace.
+    nsName = results.get('apparmor')
+
+    if nsName is not None:
+        startupChain = startupChain + \
+            ["aa-exec", "-n", nsName, "-p", "unconfined", "--"]
+    elif 'apparmor' not in results:
         if verbose:
             print(
                 "genie: AppArmor not available in kernel; attempting to continue without AppArmor namespace")
@@ -268,6 +456,25 @@ def inner_do_initialize():
         print("genie: starting systemd with command line: ")
         print(' '.join(startupChain))
 
+    # Create a socket for systemd to notify us of its readiness on, and pass it
+    # down the startup chain.
+    notify_sock = notify.open_socket()
+    startupEnv = os.environ.copy()
+
+    if notify_sock is not None:
+        startupEnv['NOTIFY_SOCKET'] = notify.notify_socket_path
+
+    # Place systemd in the bottle's cgroup, if it has one, before it is executed.
+    cgroupPath = results.get('cgroup')
+
+    if cgroupPath is not None:
+        import cgroup
+
+        def preexec():
+            cgroup.enter(cgroupPath)
+    else:
+        preexec = None
+
     # This requires real UID/GID root as well as effective UID/GID root
     suid = os.getuid()
     sgid = os.getgid()
@@ -275,35 +482,43 @@ def inner_do_initialize():
     os.setuid(0)
     os.setgid(0)
 
-    subprocess.run(startupChain)
+    booting = time.monotonic()
+
+    with spans.span('initialize.start-systemd'):
+        try:
+            subprocess.run(startupChain, env=startupEnv, preexec_fn=preexec)
+        except subprocess.SubprocessError:
+            sys.exit(f"genie: could not place systemd in the bottle's cgroup, {cgroupPath}")
 
     os.setuid(suid)
     os.setgid(sgid)
 
-    # Wait for systemd to be up (polling, sigh.)
-    sdp = 0
     print("Waiting for systemd...", end="", flush=True)
 
-    while sdp == 0:
-        time.sleep(0.5)
-        sdp = helpers.find_systemd()
-
-        print(".", end="", flush=True)
-
-    # Wait for systemd to be in running state.
-    state = 'initializing'
-    timeout = configuration.system_timeout()
-
-    while ('running' not in state and 'degraded' not in state) and timeout > 0:
-        time.sleep(1)
-        state = helpers.get_systemd_state(sdp)
-
-        print("!", end="", flush=True)
-
-        timeout -= 1
+    try:
+        with spans.span('initialize.wait-systemd'):
+            if notify_sock is not None:
+                try:
+                    sdp, state = wait_for_systemd_notify(notify_sock)
+                finally:
+                    notify.close_socket(notify_sock)
+            else:
+                sdp, state = wait_for_systemd_polling()
+    except SystemExit:
+        # systemd did not start at all.
+        metrics.count('genie_init_timeouts_total')
+        raise
 
     print("")
 
+    if 'running' in state:
+        metrics.observe('genie_boot_seconds', time.monotonic() - booting)
+    elif 'degraded' in state:
+        metrics.record(counts=[('genie_degraded_boots_total', None)],
+                       observations=[('genie_boot_seconds', None, time.monotonic() - booting)])
+    else:
+        metrics.count('genie_init_timeouts_total')
+
     if 'running' not in state:
         print(
             f"genie: systemd did not enter running state ({state}) after {configuration.system_timeout()} seconds")
@@ -311,7 +526,7 @@ def inner_do_initialize():
         print("genie: information on problematic units is available at https://github.com/arkane-systems/genie/wiki/Systemd-units-known-to-be-problematic-under-WSL")
         print("genie: a list of failed units follows:\n")
 
-        with nsenter.Namespace(sdp, 'pid'):
+        with spans.span('initialize.failed-units'), namespaces.enter(sdp, 'pid'):
             subprocess.run(["systemctl", "--failed"])
 
     # LAST: Now that systemd exists, write out its (external) pid.
@@ -321,46 +536,160 @@ def inner_do_initialize():
         pidfile.close()
 
 
-def do_initialize():
-    """Initialize the genie bottle."""
+def do_initialize(dry_run=False, ready_fd=None, started=None):
+    """Initialize the genie bottle, reporting the outcome on ready_fd, if specified."""
+    if dry_run:
+        import phases
+
+        phases.print_plan(init_phases())
+        return
+
+    try:
+        initialize_bottle(started)
+    except SystemExit as e:
+        report_ready(ready_fd, e.code not in (None, 0))
+        raise
+
+    report_ready(ready_fd, False)
+
+
+def do_detached_initialize(ready_fd):
+    """Initialize the genie bottle in the background, returning once initialization is under way."""
+    if helpers.find_systemd() != 0:
+        sys.exit("genie: bottle is already established (systemd running)")
+
+    started_r, started_w = os.pipe()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    if os.fork() != 0:
+        os.close(started_w)
+
+        if ready_fd is not None:
+            os.close(ready_fd)
+
+        # Return once the background process holds the init lock (or is waiting
+        # on another's), so that genie commands run from now on wait for it.
+        if not os.read(started_r, 1):
+            sys.exit("genie: bottle initialization could not be started in the background")
+
+        if verbose:
+            print("genie: initializing bottle in the background")
+
+        return
+
+    # In the background, away from the caller's terminal.
+    os.close(started_r)
+    os.setsid()
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+    os.close(devnull)
+
+    def started():
+        os.write(started_w, b'1')
+        os.close(started_w)
+
+    do_initialize(ready_fd=ready_fd, started=started)
+
+
+def report_ready(ready_fd, failed):
+    """Write the state of the bottle (or 'failed') to the readiness fd, if any, and close it."""
+    if ready_fd is None:
+        return
+
+    import status
+
+    state = 'failed' if failed else status.state_name(helpers.get_systemd_state(helpers.find_systemd()))
+
+    try:
+        os.write(ready_fd, f"{state}\n".encode())
+        os.close(ready_fd)
+    except OSError:
+        pass
+
+
+def initialize_bottle(started=None, exists_ok=False):
+    """Initialize the genie bottle, or wait for it to be initialized, calling started() once either is under way."""
     if verbose:
         print("genie: starting bottle")
 
     # Secure the bottle init lock
     running = bottle_init_lock()
+
+    if started is not None:
+        started()
+
     if running:
-        # Wait for other process to have started the bottle
-        # The last step is the pid file being created, so we wait
-        # for that, then return.
+        # Wait for other process to have started the bottle, blocking until
+        # it releases the init lock.
         if verbose:
-            print(
-                f"genie: already initializing, pid={running}, waiting...", end="", flush=True)
+            if running is True:
+                print("genie: already initializing, waiting...")
+            else:
+                print(f"genie: already initializing, pid={running}, waiting...")
 
         # Allow 10% startup margin
-        timeout = configuration.system_timeout() * 1.1
-
-        while not os.path.exists('/run/genie.systemd.pid') and timeout > 0:
-            time.sleep(1)
-            print(".", end="", flush=True)
-            timeout -= 1
+        status = bottle_init_wait(configuration.system_timeout() * 1.1)
 
-        print("")
-
-        if timeout <= 0:
+        if status is None:
             print("genie: WARNING: timeout waiting for bottle to start")
+        elif status != 0:
+            sys.exit(
+                f"genie: bottle initialization (pid={running}) failed, exit code = {status}")
 
         return
 
-    # Do the actual functionality of the thing.
-    inner_do_initialize()
+    # Another genie may have finished initializing the bottle between our looking
+    # for it and our taking the lock.
+    if exists_ok and helpers.find_systemd() != 0:
+        bottle_init_unlock(0)
+        return
+
+    # Do the actual functionality of the thing, recording the outcome for
+    # any waiters when we unlock the init lock.
+    import spans
+
+    status = 1
+
+    try:
+        with spans.span('initialize'):
+            inner_do_initialize()
+
+        status = 0
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        raise
+    finally:
+        bottle_init_unlock(status)
+
+        import metrics
+
+        metrics.count('genie_inits_total', {'outcome': 'success' if status == 0 else 'failure'})
 
-    # Unlock the init lock
-    bottle_init_unlock()
+    # If configured to, start the broker to serve later requests.
+    if configuration.broker():
+        import broker
+
+        if verbose:
+            print("genie: starting broker")
+
+        broker.start(dispatch_broker_request)
 
 
 # Run inside bottle.
 def do_shell():
     """Start a shell inside the bottle, initializing it if necessary."""
+    import subprocess
+
+    import namespaces
 
     if verbose:
         print("genie: starting shell")
@@ -375,12 +704,15 @@ def do_shell():
 
     # At this point, we should be outside a bottle, one way or another.
     # Get the bottle namespace
-    with nsenter.Namespace(sdp, 'pid'):
+    with namespaces.enter(sdp, 'pid'):
         subprocess.run("machinectl shell -q " + login + "@.host", shell=True)
 
 
 def do_login():
     """Start a login prompt inside the bottle, initializing it if necessary."""
+    import subprocess
+
+    import namespaces
 
     if verbose:
         print("genie: starting login prompt")
@@ -395,12 +727,23 @@ def do_login():
 
     # At this point, we should be outside a bottle, one way or another.
     # Get the bottle namespace
-    with nsenter.Namespace(sdp, 'pid'):
+    with namespaces.enter(sdp, 'pid'):
         subprocess.run("machinectl login .host", shell=True)
 
 
-def do_command(commandline):
+def do_command(commandline, direct_command=False, pipe_command=False):
     """Run a command in a user session inside the bottle, initializing it if necessary."""
+    import spans
+
+    with spans.span('command'):
+        mode, command, env = command_to_run(commandline, direct_command, pipe_command)
+
+    record_dispatch(mode)
+    exec_command(command, env)
+
+
+def command_to_run(commandline, direct_command, pipe_command=False):
+    """Work out how to run a command inside the bottle, initializing it if necessary; returns the mode, command line and environment."""
 
     if verbose:
         print("genie: running command " + ' '.join(commandline))
@@ -412,24 +755,123 @@ def do_command(commandline):
 
     if sdp == 1:
         # we're already inside the bottle
-        ic = subprocess.run(commandline)
-        return ic.returncode
+        return 'inside', commandline, None
 
     pre_systemd_action_checks(sdp)
 
     sdp = helpers.find_systemd()
 
-    command = ["machinectl", "shell", "-q", login + "@.host",
+    if direct_command:
+        import direct
+
+        # Enter the bottle directly, without a session.
+        return 'direct', direct.command_line(sdp, login, os.getcwd(), commandline), direct.environment(login)
+
+    if pipe_command:
+        # systemd-run starts the command in a login session, as machinectl shell does,
+        # but hands it our standard input, output and error as they are, rather than
+        # a pseudo-terminal; it waits for the command, and passes on its exit status.
+        command = ["nsenter", "--target", str(sdp), "--pid", "--",
+                   "systemd-run", "--quiet", "--pipe", "--wait", "--collect",
+                   f"--uid={login}", "--property=PAMName=login",
+                   "/usr/lib/genie/runinwsl", os.getcwd()] + commandline
+
+        return 'pipe', command, None
+
+    # nsenter forks the command into the bottle's pid namespace, and waits for it,
+    # passing on its exit status or terminating signal.
+    command = ["nsenter", "--target", str(sdp), "--pid", "--",
+               "machinectl", "shell", "-q", login + "@.host",
                "/usr/lib/genie/runinwsl", os.getcwd()] + commandline
 
-    with nsenter.Namespace(sdp, 'pid'):
-        sp = subprocess.run(command)
-        return sp
+    return 'machinectl', command, None
+
+
+def do_batch(jobs, output):
+    """Run a batch of commands read from standard input inside the bottle, initializing it if necessary."""
+    import batch
+
+    commands = batch.read_commands(sys.stdin.buffer.read())
+
+    if len(commands) == 0:
+        sys.exit("genie: no commands in batch")
+
+    if verbose:
+        print(f"genie: running batch of {len(commands)} commands, {jobs} at a time")
+
+    sdp = helpers.find_systemd()
+
+    if sdp != 1:
+        pre_systemd_action_checks(sdp)
+
+        sdp = helpers.find_systemd()
+
+    record_dispatch('batch')
+    sys.exit(batch.run(sdp, login, os.getcwd(), commands, jobs, output, verbose))
+
+
+def record_dispatch(mode):
+    """Record how long genie took, from its starting, to get as far as running a command."""
+    import metrics
+
+    # Measured from the start of the process (i.e., of the setuid wrapper), or
+    # for the broker, of its client, so as to include interpreter startup.
+    start_time = client_start_time if client_start_time is not None else process_start_time()
+
+    if start_time is not None:
+        elapsed = time.clock_gettime(time.CLOCK_BOOTTIME) - start_time
+        metrics.observe('genie_command_dispatch_seconds', max(elapsed, 0), {'mode': mode})
+
+
+def process_start_time():
+    """Get when this process started, in seconds after boot, to within a clock tick; or None."""
+    start_time = bottle.get_start_time('self')
+
+    return start_time / os.sysconf('SC_CLK_TCK') if start_time is not None else None
+
+
+def exec_command(commandline, env=None):
+    """Replace this process with the specified command; does not return."""
+    import spans
+
+    # This process will not exit as such, so finish its spans now.
+    spans.finish()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        if env is None:
+            os.execvp(commandline[0], commandline)
+        else:
+            os.execvpe(commandline[0], commandline, env)
+    except OSError as e:
+        print(f"genie: error running command '{commandline[0]}': {e.strerror}", file=sys.stderr)
+        sys.exit(127)
 
 
 # Shut down bottle.
 def do_shutdown():
     """Shutdown the genie bottle and clean up."""
+    import spans
+
+    with spans.span('shutdown'):
+        inner_do_shutdown()
+
+
+def inner_do_shutdown():
+    """Shutdown the genie bottle and clean up (inner function)."""
+    import subprocess
+
+    import apparmor
+    import binfmts
+    import cgroup
+    import host
+    import metrics
+    import namespaces
+    import resolved
+    import spans
+
     sdp = helpers.find_systemd()
 
     if sdp == 0:
@@ -444,44 +886,115 @@ def do_shutdown():
         sys.exit(
             f"genie: bottle is currently {state}; please wait until it is in a stable state")
 
+    # Hold on to the bottle's systemd before asking it to exit, so that we can
+    # wait for it to do so.
+    bottle.pidfd(sdp)
+
     if verbose:
         print("genie: running systemctl poweroff within bottle")
 
-    with nsenter.Namespace(sdp, 'pid'):
+    stopping = time.monotonic()
+
+    with spans.span('shutdown.poweroff'), namespaces.enter(sdp, 'pid'):
         subprocess.run(["systemctl", "poweroff"])
 
     # Wait for systemd to exit.
     print("Waiting for systemd to exit...", end="", flush=True)
 
-    timeout = configuration.system_timeout()
-
-    while helpers.find_systemd() != 0 and timeout > 0:
-        time.sleep(1)
-        print(".", end="", flush=True)
-
-        timeout -= 1
+    with spans.span('shutdown.wait-exit'):
+        exited = wait_for_systemd_exit(sdp)
 
     print("")
 
-    if (timeout <= 0):
+    if not exited:
+        metrics.count('genie_shutdown_timeouts_total')
+
         print(
             f"genie: systemd did not exit after {configuration.system_timeout()} seconds")
         print("genie: this may be due to a problem with your systemd configuration")
         print("genie: attempting to continue")
+    else:
+        metrics.observe('genie_shutdown_seconds', time.monotonic() - stopping)
+
+        # systemd has exited, so the bottle registry and pid file are no longer valid.
+        bottle.forget()
+
+        if os.path.exists('/run/genie.systemd.pid'):
+            os.remove('/run/genie.systemd.pid')
 
     # Reverse the processes we performed to prepare the bottle as the post-shutdown
-    # cleanup, only in reverse.
+    # cleanup. These steps are independent of one another, so run them concurrently.
+    steps = []
+
     if apparmor.exists():
-        apparmor.unconfigure(verbose)
+        steps.append(('apparmor', apparmor.unconfigure))
 
-    binfmts.mount(verbose)
+    steps.append(('binfmts', binfmts.mount))
+
+    # Remove the bottle's cgroup, if it has one, whatever the configuration now says.
+    if cgroup.exists():
+        steps.append(('cgroup', cgroup.remove))
 
     # If configured to, remove the resolv.conf symlink for systemd-resolved.
     if configuration.resolved_stub():
-        resolved.unconfigure(verbose)
+        steps.append(('resolved', resolved.unconfigure))
 
     if configuration.update_hostname():
-        host.restore(verbose)
+        steps.append(('hostname', host.restore))
+
+    with spans.span('shutdown.teardown'):
+        run_teardown_steps(steps)
+
+
+def wait_for_systemd_exit(sdp):
+    """Wait for systemd to exit, up to the configured timeout; returns True if it did."""
+    timeout = configuration.system_timeout()
+
+    exited = bottle.wait_for_exit(sdp, timeout)
+
+    if exited is not None:
+        return exited
+
+    # No pidfd support; fall back to polling.
+    while helpers.find_systemd() != 0 and timeout > 0:
+        time.sleep(1)
+        print(".", end="", flush=True)
+
+        timeout -= 1
+
+    return timeout > 0
+
+
+def run_teardown_steps(steps):
+    """Run the (name, function) teardown steps concurrently, reporting how long each took."""
+    import concurrent.futures
+
+    import output
+    import spans
+
+    outputs = {}
+
+    def timed(name, function):
+        start = time.monotonic()
+        with output.collected(outputs, name), spans.span(f'shutdown.teardown.{name}'):
+            function(verbose)
+        return time.monotonic() - start
+
+    with output.collecting(), concurrent.futures.ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        futures = [(name, executor.submit(timed, name, function)) for name, function in steps]
+
+        for name, future in futures:
+            concurrent.futures.wait([future])
+            output.show(outputs, name)
+
+            try:
+                elapsed = future.result()
+            except Exception as e:
+                print(f"genie: teardown step '{name}' failed ({e}); attempting to continue")
+                continue
+
+            if verbose:
+                print(f"genie: teardown step '{name}' took {elapsed:.3f}s")
 
 
 # Status checks.
@@ -531,27 +1044,150 @@ def do_is_in_bottle():
     sys.exit(1)
 
 
+def do_status(as_json):
+    """Display the status of the bottle, collected in one pass."""
+    import status
+
+    st = status.collect(helpers.find_systemd())
+
+    if as_json:
+        import json
+
+        print(json.dumps(st))
+    else:
+        status.print_status(st)
+
+    sys.exit(status.exit_status(st['state']))
+
+
+def do_metrics(path):
+    """Display genie's metrics in Prometheus text format, or write them to the specified file."""
+    import pwd
+
+    import metrics
+
+    text = metrics.render()
+
+    if path == '-':
+        print(text, end='')
+        return
+
+    # Write as the invoking user, not as root (the wrapper makes us root through
+    # and through), and atomically, since a collector may read the file at any time.
+    pw = pwd.getpwnam(login)
+    groups = os.getgroups()
+
+    if pw.pw_uid != 0:
+        os.setgroups(os.getgrouplist(pw.pw_name, pw.pw_gid))
+        os.setegid(pw.pw_gid)
+        os.seteuid(pw.pw_uid)
+
+    temp = os.path.join(os.path.dirname(os.path.abspath(path)), f".{os.path.basename(path)}.genie-{os.getpid()}")
+
+    try:
+        with open(temp, 'w') as metricsfile:
+            metricsfile.write(text)
+            os.fchmod(metricsfile.fileno(), 0o644)
+
+        os.replace(temp, path)
+    except OSError as e:
+        if os.path.exists(temp):
+            os.remove(temp)
+        sys.exit(f"genie: could not write metrics to '{path}': {e.strerror}")
+    finally:
+        if pw.pw_uid != 0:
+            os.seteuid(0)
+            os.setegid(0)
+            os.setgroups(groups)
+
+
+# Broker requests.
+def broker_request(arguments):
+    """Build the broker request for the specified arguments, or None if the broker cannot handle them."""
+    if arguments.command is not None:
+        if len(arguments.command) == 0:
+            return None
+        req = {'op': 'run', 'cwd': os.getcwd(), 'command': arguments.command,
+               'direct': arguments.direct, 'pipe': arguments.pipe}
+    elif arguments.shell:
+        req = {'op': 'shell'}
+    elif arguments.is_running:
+        req = {'op': 'status'}
+    elif arguments.shutdown:
+        req = {'op': 'shutdown'}
+    else:
+        return None
+
+    req['user'] = login
+    req['verbose'] = verbose
+    req['trace'] = arguments.trace
+    req['started'] = process_start_time()
+
+    return req
+
+
+def dispatch_broker_request(req):
+    """Carry out a request received by the broker; returns the exit status."""
+    global verbose
+    global login
+    global client_start_time
+
+    verbose = req.get('verbose', False)
+    login = req.get('user')
+    client_start_time = req.get('started')
+
+    if req.get('trace', False):
+        import spans
+
+        spans.show = True
+
+    try:
+        if req['op'] == 'run':
+            os.chdir(req['cwd'])
+            do_command(req['command'], req.get('direct', False), req.get('pipe', False))
+        elif req['op'] == 'shell':
+            do_shell()
+        elif req['op'] == 'status':
+            do_is_running()
+        elif req['op'] == 'shutdown':
+            do_shutdown()
+        else:
+            sys.exit(f"genie: broker does not understand request '{req['op']}'")
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+
+    return 0
+
+
 # Entrypoint
 def entrypoint():
     """Entrypoint of the application."""
     global verbose
     global login
 
-    helpers.prelaunch_checks()
-    configuration.load()
     arguments = parse_command_line()
 
     # Set globals
     verbose = arguments.verbose
     login = helpers.get_login_session_user()
 
+    if arguments.trace:
+        import spans
+
+        spans.show = True
+
     # Check user
     if arguments.user is not None:
 
-        # Abort if user specified and not -c or -s
-        if not (arguments.shell or (arguments.command is not None)):
+        # Abort if user specified and not -c, -s or --batch
+        if not (arguments.shell or arguments.batch or (arguments.command is not None)):
             sys.exit(
-                "genie: error: argument -a/--as-user can only be used with -c/--command or -s/--shell")
+                "genie: error: argument -a/--as-user can only be used with -c/--command, -s/--shell or --batch")
 
         # Check if arguments.user is a real user
         helpers.validate_is_real_user(arguments.user)
@@ -561,23 +1197,79 @@ def entrypoint():
         if verbose:
             print(f"genie: executing as user {login}")
 
+    # Abort if direct specified and not -c
+    if arguments.direct and arguments.command is None:
+        sys.exit("genie: error: argument -d/--direct can only be used with -c/--command")
+
+    # Abort if pipe specified and not -c, or with direct
+    if arguments.pipe and arguments.command is None:
+        sys.exit("genie: error: argument -p/--pipe can only be used with -c/--command")
+
+    if arguments.pipe and arguments.direct:
+        sys.exit("genie: error: argument -p/--pipe cannot be used with -d/--direct")
+
+    # Abort if batch options specified and not --batch
+    if (arguments.jobs != 1 or arguments.batch_output != 'prefix') and not arguments.batch:
+        sys.exit("genie: error: arguments -j/--jobs and --batch-output can only be used with --batch")
+
+    if arguments.jobs < 1:
+        sys.exit("genie: error: argument -j/--jobs must be at least 1")
+
+    # Abort if dry run, detach or readiness fd specified and not -i
+    if (arguments.dry_run or arguments.detach or arguments.ready_fd is not None) and not arguments.initialize:
+        sys.exit("genie: error: arguments --dry-run, --detach and --ready-fd can only be used with -i/--initialize")
+
+    if arguments.dry_run and (arguments.detach or arguments.ready_fd is not None):
+        sys.exit("genie: error: argument --dry-run cannot be used with --detach or --ready-fd")
+
+    if arguments.ready_fd is not None and (arguments.ready_fd < 3 or not os.path.exists(f'/proc/self/fd/{arguments.ready_fd}')):
+        sys.exit(f"genie: error: argument --ready-fd: {arguments.ready_fd} is not an open file descriptor above 2")
+
+    # Abort if JSON specified and not --status
+    if arguments.json and not arguments.status:
+        sys.exit("genie: error: argument --json can only be used with --status")
+
+    # If a broker is running, hand the request over to it. (Look for its socket
+    # before importing the broker module, which most invocations do not need.)
+    req = broker_request(arguments)
+
+    if req is not None and os.path.exists('/run/genie.broker'):
+        import broker
+
+        status = broker.request(req)
+
+        if status is not None:
+            sys.exit(status)
+
+    helpers.prelaunch_checks()
+    configuration.load()
+
     # Decide what to do.
     if arguments.parser_test:
         do_parser_test(arguments)
     elif arguments.initialize:
-        do_initialize()
+        if arguments.detach:
+            do_detached_initialize(arguments.ready_fd)
+        else:
+            do_initialize(arguments.dry_run, arguments.ready_fd)
     elif arguments.shell:
         do_shell()
     elif arguments.login:
         do_login()
     elif arguments.command is not None:
-        do_command(arguments.command)
+        do_command(arguments.command, arguments.direct, arguments.pipe)
+    elif arguments.batch:
+        do_batch(arguments.jobs, arguments.batch_output)
     elif arguments.shutdown:
         do_shutdown()
     elif arguments.is_running:
         do_is_running()
     elif arguments.is_in_bottle:
         do_is_in_bottle()
+    elif arguments.status:
+        do_status(arguments.json)
+    elif arguments.metrics is not None:
+        do_metrics(arguments.metrics)
     else:
         sys.exit("genie: impossible argument - how did we get here?")
 
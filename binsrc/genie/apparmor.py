@@ -1,17 +1,15 @@
 # AppArmor control module
 
 import os
-import subprocess
 
+import facts
 import helpers
+import syscalls
 
 
 def exists():
     """Determine whether AppArmor support exists in the kernel."""
-    if os.path.exists('/sys/module/apparmor'):
-        return True
-    else:
-        return False
+    return facts.get('apparmor', lambda: os.path.exists('/sys/module/apparmor'))
 
 
 def configure(verbose):
@@ -22,9 +20,9 @@ def configure(verbose):
         if verbose:
             print("genie: mounting AppArmor filesystem")
 
-        sp = subprocess.run(['mount', '-t', 'securityfs',
-                             'securityfs', '/sys/kernel/security'])
-        if sp.returncode != 0:
+        try:
+            syscalls.mount('securityfs', '/sys/kernel/security', 'securityfs')
+        except OSError:
             print(
                 "genie: failed to mount AppArmor filesystem; attempting to continue without AppArmor")
             return None
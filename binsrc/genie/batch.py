@@ -0,0 +1,202 @@
+# Batch command module
+#
+# Runs a list of commands inside the bottle, entering its namespaces once for
+# the whole batch rather than once per command, one at a time or several at
+# once, with the output of each prefixed with or collected under its number.
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import direct
+
+
+# functions
+def read_commands(data):
+    """Parse a batch of commands: a JSON list, or NUL-delimited, or newline-delimited; returns a list of argument lists."""
+    try:
+        text = data.decode()
+    except UnicodeDecodeError as e:
+        sys.exit(f"genie: could not read batch: not valid UTF-8 at byte {e.start}")
+
+    # JSON: a list, each member either a shell command string or an argument list.
+    if text.lstrip().startswith('['):
+        try:
+            items = json.loads(text)
+        except ValueError as e:
+            sys.exit(f"genie: could not parse batch as JSON: {e}")
+
+        if not isinstance(items, list):
+            sys.exit("genie: batch JSON must be a list of commands")
+
+        commands = []
+        for item in items:
+            if isinstance(item, str):
+                commands.append(["sh", "-c", item])
+            elif isinstance(item, list) and item and all(isinstance(a, str) for a in item):
+                commands.append(item)
+            else:
+                sys.exit(f"genie: batch JSON command must be a string or a list of strings, not {json.dumps(item)}")
+
+        return commands
+
+    # Otherwise, one shell command per NUL-terminated string, or per line (skipping
+    # blank lines and comments).
+    if '\0' in text:
+        items = text.split('\0')
+    else:
+        items = [line for line in text.splitlines() if not line.lstrip().startswith('#')]
+
+    return [["sh", "-c", item] for item in items if item.strip()]
+
+
+def describe(command):
+    """Describe a command for display."""
+    if len(command) == 3 and command[:2] == ["sh", "-c"]:
+        return command[2]
+
+    return ' '.join(command)
+
+
+def run(sdp, user, cwd, commands, jobs, output, verbose):
+    """Run the batch of commands inside the bottle as user, in cwd, up to jobs at once; returns the exit status."""
+    import namespaces
+
+    if sdp == 1:
+        # Already inside the bottle; only the user need change.
+        return _run_batch(user, commands, None, jobs, output, verbose)
+
+    env = direct.environment(user)
+
+    # Enter the bottle's pid and mount namespaces once, for all the commands.
+    with namespaces.enter(sdp, 'pid', 'mnt'):
+        try:
+            os.chdir(cwd)
+        except OSError as e:
+            sys.exit(f"genie: cannot change to directory '{cwd}' in the bottle: {e.strerror}")
+
+        return _run_batch(user, commands, env, jobs, output, verbose)
+
+
+# Internal functions
+def _run_batch(user, commands, env, jobs, output, verbose):
+    """Run the batch of commands, up to jobs at once, reporting on each; returns the exit status."""
+    import selectors
+
+    # No threads here: once in the bottle's pid namespace, we cannot start any.
+    width = len(str(len(commands)))
+    selector = selectors.DefaultSelector()
+
+    waiting = list(enumerate(commands, 1))
+    running = 0
+    results = {}
+    collected = {}
+    next_to_print = 1
+
+    # Output is written to the underlying buffer from here on.
+    sys.stdout.flush()
+
+    while waiting or running:
+        while waiting and running < jobs:
+            number, command = waiting.pop(0)
+            job = _start_command(number, width, direct.user_command_line(user, command), env)
+
+            if job['proc'] is None:
+                _output(job, output, job['error'], final=True)
+                results[number] = (127, 0.0)
+                collected[number] = job['output']
+                continue
+
+            selector.register(job['proc'].stdout, selectors.EVENT_READ, job)
+            running += 1
+
+        # If the last commands to start could not be, there is nothing to wait for.
+        ready = selector.select() if running else []
+
+        for key, _ in ready:
+            job = key.data
+            data = os.read(key.fd, 65536)
+
+            if data:
+                _output(job, output, data)
+                continue
+
+            # End of output; the command is done.
+            selector.unregister(key.fileobj)
+            job['proc'].stdout.close()
+            running -= 1
+
+            _output(job, output, b'', final=True)
+
+            status = job['proc'].wait()
+            if status < 0:
+                status = 128 - status
+
+            results[job['number']] = (status, time.monotonic() - job['start'])
+            collected[job['number']] = job['output']
+
+        # Collected output is printed in order, as soon as each command and those
+        # before it are done.
+        if output == 'collect':
+            while next_to_print in collected:
+                command = commands[next_to_print - 1]
+
+                sys.stdout.buffer.write(f"==> [{next_to_print:{width}}] {describe(command)} <==\n".encode())
+                sys.stdout.buffer.write(collected.pop(next_to_print))
+                sys.stdout.buffer.flush()
+
+                next_to_print += 1
+
+    selector.close()
+
+    # Report how each command went.
+    failed = 0
+
+    for number, command in enumerate(commands, 1):
+        status, elapsed = results[number]
+
+        if status != 0:
+            failed += 1
+
+        print(f"genie: [{number:{width}}] exit {status} in {elapsed:.3f}s: {describe(command)}",
+              file=sys.stderr)
+
+    if verbose:
+        print(f"genie: batch of {len(commands)} commands, {failed} failed", file=sys.stderr)
+
+    # As with xargs and parallel, the number of failures is the exit status.
+    return min(failed, 100)
+
+
+def _start_command(number, width, command, env):
+    """Start one command of a batch, with its output on a pipe; returns its job state."""
+    job = {'number': number, 'prefix': f"[{number:{width}}] ".encode(), 'start': time.monotonic(),
+           'proc': None, 'error': b'', 'pending': b'', 'output': b''}
+
+    try:
+        job['proc'] = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, env=env)
+    except OSError as e:
+        job['error'] = f"genie: error running command '{command[0]}': {e.strerror}\n".encode()
+
+    return job
+
+
+def _output(job, output, data, final=False):
+    """Handle output from a command: write out whole lines, prefixed, or collect it."""
+    if output == 'collect':
+        job['output'] += data
+        return
+
+    lines = (job['pending'] + data).split(b'\n')
+    job['pending'] = lines.pop()
+
+    if final and job['pending']:
+        lines.append(job['pending'])
+        job['pending'] = b''
+
+    if lines:
+        sys.stdout.buffer.write(b''.join(job['prefix'] + line + b'\n' for line in lines))
+        sys.stdout.buffer.flush()
@@ -1,7 +1,8 @@
 # Binary formats function module
 
 import os
-import subprocess
+
+import syscalls
 
 
 def mount(verbose):
@@ -16,10 +17,9 @@ def mount(verbose):
         if verbose:
             print("genie: remounting binfmt_misc filesystem as a courtesy")
 
-        sp = subprocess.run(['mount', '-t', 'binfmt_misc',
-                             'binfmt_misc', '/proc/sys/fs/binfmt_misc'])
-
-        if sp.returncode != 0:
+        try:
+            syscalls.mount('binfmt_misc', '/proc/sys/fs/binfmt_misc', 'binfmt_misc')
+        except OSError:
             print(
                 "genie: failed to remount binfmt_misc filesystem; attempting to continue")
 
@@ -31,9 +31,9 @@ def umount(verbose):
         if verbose:
             print("genie: unmounting binfmt_misc filesystem before proceeding")
 
-        sp = subprocess.run(['umount', '/proc/sys/fs/binfmt_misc'])
-
-        if sp.returncode != 0:
+        try:
+            syscalls.umount('/proc/sys/fs/binfmt_misc')
+        except OSError:
             print(
                 "genie: failed to unmount binfmt_misc filesystem; attempting to continue")
 
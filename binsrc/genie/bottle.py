@@ -0,0 +1,141 @@
+# Bottle registry module
+
+import os
+import select
+
+# Global variables
+
+registry_file = '/run/genie.bottle'
+
+_pidfd = None
+_pidfd_pid = 0
+
+
+# functions
+def record(sdp):
+    """Record the external pid of the bottle's systemd, with its start time and pid namespace."""
+    start_time = get_start_time(sdp)
+    ns_inode = get_pid_namespace(sdp)
+
+    if start_time is None or ns_inode is None:
+        return
+
+    with open(registry_file, 'w') as regfile:
+        print(f"{sdp} {start_time} {ns_inode}", file=regfile)
+        regfile.close()
+
+    os.chmod(registry_file, 0o644)
+
+
+def forget():
+    """Remove the bottle registry, if it exists."""
+    global _pidfd
+    global _pidfd_pid
+
+    if os.path.exists(registry_file):
+        os.remove(registry_file)
+
+    if _pidfd is not None:
+        os.close(_pidfd)
+        _pidfd = None
+        _pidfd_pid = 0
+
+
+def load():
+    """Load the bottle registry; returns (pid, start time, pid namespace inode), or None."""
+    try:
+        with open(registry_file, 'r') as regfile:
+            fields = regfile.read().split()
+    except OSError:
+        return None
+
+    if len(fields) != 3:
+        return None
+
+    try:
+        return (int(fields[0]), int(fields[1]), int(fields[2]))
+    except ValueError:
+        return None
+
+
+def lookup():
+    """Find the bottle's systemd from the registry; returns 1 if inside the bottle, 0 if the registry is stale or absent, or the external pid."""
+    reg = load()
+
+    if reg is None:
+        return 0
+
+    sdp, start_time, ns_inode = reg
+
+    if get_pid_namespace('self') == ns_inode:
+        return 1
+
+    if get_start_time(sdp) != start_time:
+        return 0
+
+    # Hold the process by pidfd, and recheck, so that it cannot be recycled from under us.
+    if pidfd(sdp) is not None and get_start_time(sdp) != start_time:
+        return 0
+
+    return sdp
+
+
+def pidfd(sdp):
+    """Get a pidfd referring to the specified process, held for the lifetime of this invocation."""
+    global _pidfd
+    global _pidfd_pid
+
+    if _pidfd is not None and _pidfd_pid == sdp:
+        return _pidfd
+
+    if not hasattr(os, 'pidfd_open'):
+        return None
+
+    try:
+        fd = os.pidfd_open(sdp)
+    except OSError:
+        return None
+
+    if _pidfd is not None:
+        os.close(_pidfd)
+
+    _pidfd = fd
+    _pidfd_pid = sdp
+
+    return _pidfd
+
+
+def wait_for_exit(sdp, timeout):
+    """Wait on a pidfd for the process to exit; returns True if it did, False on timeout, or None if no pidfd is available."""
+    fd = pidfd(sdp)
+
+    if fd is None:
+        return None
+
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+
+    return len(poller.poll(timeout * 1000)) > 0
+
+
+def get_start_time(pid):
+    """Get the start time of a process, in clock ticks after boot, from /proc/<pid>/stat."""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as statfile:
+            stat = statfile.read()
+    except OSError:
+        return None
+
+    # The command name may contain spaces and parentheses, so split after the last ')'.
+    fields = stat[stat.rfind(')') + 2:].split()
+
+    # starttime is field 22 of stat; field 3 is the first after the command name.
+    return int(fields[19])
+
+
+def get_pid_namespace(pid):
+    """Get the inode number of the pid namespace of a process."""
+    try:
+        return os.stat(f'/proc/{pid}/ns/pid').st_ino
+    except OSError:
+        return None
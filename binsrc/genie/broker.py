@@ -0,0 +1,278 @@
+# Request broker module
+#
+# The broker is a long-lived genie process, started with the bottle, which keeps
+# the configuration and bottle state in memory and carries out requests from
+# genie clients received over a root-owned Unix socket. The client passes its
+# standard file descriptors along with the request, so that commands run by
+# the broker read from and write to the caller's terminal or pipes directly.
+
+import array
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+
+import bottle
+import busclient
+import helpers
+import spans
+
+# Global variables
+
+socket_path = '/run/genie.broker'
+
+# Signals which the client forwards to the command the broker is running for it.
+forwarded_signals = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT, signal.SIGWINCH]
+
+_max_message = 65536
+
+
+# Client functions
+def request(req):
+    """Send a request to the broker and wait for it to complete; returns its exit status, or None if there is no broker."""
+    if not os.path.exists(socket_path):
+        return None
+
+    # Requests made from inside the bottle are not the broker's business.
+    if bottle.lookup() == 1:
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        # Stale socket, or not permitted; carry on without the broker.
+        sock.close()
+        return None
+
+    fds = array.array('i', [0, 1, 2])
+    sock.sendmsg([json.dumps(req).encode()],
+                 [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+
+    # Forward signals to the command, rather than dying and leaving it running.
+    def forward(signum, frame):
+        try:
+            sock.send(json.dumps({'signal': signum}).encode())
+        except OSError:
+            pass
+
+    for s in forwarded_signals:
+        signal.signal(s, forward)
+
+    while True:
+        msg = sock.recv(_max_message)
+
+        if not msg:
+            sys.exit("genie: lost connection to broker")
+
+        reply = json.loads(msg)
+
+        if 'exit' in reply:
+            sock.close()
+            return reply['exit']
+
+
+# Server functions
+def start(dispatch):
+    """Start the broker as a daemon, to carry out requests with the dispatch function."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+
+    if pid != 0:
+        os.waitpid(pid, 0)
+        return
+
+    # Detach fully from the caller.
+    os.setsid()
+
+    if os.fork() != 0:
+        os._exit(0)
+
+    os.chdir('/')
+
+    # Requests get bus connections of their own; don't share the caller's. Nor
+    # should they log the spans the caller recorded before starting us.
+    busclient.close()
+    spans.reset()
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    try:
+        serve(dispatch)
+    finally:
+        os._exit(0)
+
+
+def serve(dispatch):
+    """Accept and carry out requests until the bottle's systemd exits."""
+    sdp = helpers.find_systemd()
+
+    if sdp == 0 or sdp == 1:
+        return
+
+    if os.path.lexists(socket_path):
+        os.remove(socket_path)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    listener.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    listener.listen(64)
+
+    # Handlers are never waited for.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    sdfd = bottle.pidfd(sdp)
+
+    try:
+        while True:
+            watch = [listener] if sdfd is None else [listener, sdfd]
+            readable, _, _ = select.select(watch, [], [], 5 if sdfd is None else None)
+
+            # Exit along with the bottle.
+            if sdfd in readable or (sdfd is None and helpers.find_systemd() != sdp):
+                break
+
+            if listener in readable:
+                conn, _ = listener.accept()
+
+                if os.fork() == 0:
+                    try:
+                        listener.close()
+                        _handle(conn, dispatch)
+                    finally:
+                        os._exit(0)
+
+                conn.close()
+    finally:
+        listener.close()
+
+        if os.path.lexists(socket_path):
+            os.remove(socket_path)
+
+
+def _handle(conn, dispatch):
+    """Carry out a single request (in a handler process forked from the broker)."""
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    msg, ancdata, _, _ = conn.recvmsg(_max_message, socket.CMSG_SPACE(3 * array.array('i').itemsize))
+
+    fds = array.array('i')
+    for level, type, data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+
+    # Only root (i.e., the setuid genie) may make requests.
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+
+    if uid != 0 or len(fds) != 3 or not msg:
+        for fd in fds:
+            os.close(fd)
+        _reply(conn, {'exit': 1})
+        return
+
+    req = json.loads(msg)
+
+    worker = os.fork()
+
+    if worker == 0:
+        conn.close()
+        os.setpgid(0, 0)
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+
+        sys.stdout.reconfigure(line_buffering=True)
+
+        spans.reset()
+
+        status = 1
+        try:
+            status = dispatch(req)
+        finally:
+            # os._exit skips the atexit handlers, so log this request's spans now.
+            spans.finish()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    for fd in fds:
+        os.close(fd)
+
+    # The worker execs the command, so watch for its exit on a pidfd, which
+    # (unlike a pipe) lasts across the exec; failing that, poll for it.
+    workerfd = _pidfd_open(worker)
+    watch = [conn] if workerfd is None else [conn, workerfd]
+
+    try:
+        while True:
+            pid, wstatus = os.waitpid(worker, os.WNOHANG)
+
+            if pid == worker:
+                break
+
+            readable, _, _ = select.select(watch, [], [], 0.1 if workerfd is None else None)
+
+            if conn not in readable:
+                continue
+
+            msg = conn.recv(_max_message)
+
+            if not msg:
+                # The client has gone away; so should the command.
+                _signal_worker(worker, signal.SIGHUP)
+                _, wstatus = os.waitpid(worker, 0)
+                break
+
+            signum = json.loads(msg).get('signal')
+            if signum is not None:
+                _signal_worker(worker, signum)
+    finally:
+        if workerfd is not None:
+            os.close(workerfd)
+
+    if os.WIFSIGNALED(wstatus):
+        status = 128 + os.WTERMSIG(wstatus)
+    else:
+        status = os.WEXITSTATUS(wstatus)
+
+    _reply(conn, {'exit': status})
+
+
+def _reply(conn, reply):
+    """Send a reply to the client, if it is still listening."""
+    try:
+        conn.send(json.dumps(reply).encode())
+    except OSError:
+        pass
+
+    conn.close()
+
+
+def _pidfd_open(pid):
+    """Get a pidfd referring to the specified child process, or None if the kernel (or Python) has none."""
+    if not hasattr(os, 'pidfd_open'):
+        return None
+
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+
+def _signal_worker(worker, signum):
+    """Send a signal to the worker's process group."""
+    try:
+        os.killpg(worker, signum)
+    except OSError:
+        pass
@@ -0,0 +1,357 @@
+# Minimal D-Bus client module
+#
+# Just enough of the D-Bus wire protocol to call methods on, and read properties
+# from, the bottle's systemd without forking systemctl or entering its namespace.
+# Only systemd's private socket is used, since only there can we check (by its
+# credentials) that the peer is the bottle's systemd, and not some other.
+
+import os
+import socket
+import struct
+
+# Global variables
+
+private_socket_path = '/run/systemd/private'
+
+timeout = 5
+
+_connection = None
+_connection_pid = None
+_serial = 0
+
+_alignments = {'y': 1, 'b': 4, 'n': 2, 'q': 2, 'i': 4, 'u': 4, 'x': 8, 't': 8,
+               'd': 8, 'h': 4, 's': 4, 'o': 4, 'g': 1, 'a': 4, '(': 8, '{': 8, 'v': 1}
+
+_fixed = {'y': 'B', 'b': 'I', 'n': 'h', 'q': 'H', 'i': 'i', 'u': 'I', 'x': 'q',
+          't': 'Q', 'd': 'd', 'h': 'I'}
+
+# Header field codes
+_PATH = 1
+_INTERFACE = 2
+_MEMBER = 3
+_ERROR_NAME = 4
+_REPLY_SERIAL = 5
+_DESTINATION = 6
+_SIGNATURE = 8
+
+# Message types
+_METHOD_CALL = 1
+_METHOD_RETURN = 2
+_ERROR = 3
+
+
+class BusError(Exception):
+    """An error communicating with, or returned by, a D-Bus peer."""
+    pass
+
+
+# functions
+def connect(sdp):
+    """Connect to the bottle's systemd, whose pid is sdp (or 1, inside the bottle), unless already connected to it."""
+    global _connection
+    global _connection_pid
+
+    if _connection is not None:
+        if _connection_pid == sdp:
+            return
+        close()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+
+    try:
+        sock.connect(private_socket_path)
+
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, _, _ = struct.unpack('3i', creds)
+
+        if pid != sdp:
+            raise BusError(f"{private_socket_path}: peer is pid {pid}, not the bottle's systemd ({sdp})")
+
+        _authenticate(sock)
+    except (OSError, BusError):
+        sock.close()
+        raise
+
+    _connection = sock
+    _connection_pid = sdp
+
+
+def get_manager_property(name):
+    """Get a property of the systemd manager object."""
+    return get_property('/org/freedesktop/systemd1', 'org.freedesktop.systemd1.Manager', name)
+
+
+def get_manager_properties():
+    """Get all the properties of the systemd manager object, as a dict of (signature, value) variants."""
+    return call('/org/freedesktop/systemd1', 'org.freedesktop.DBus.Properties', 'GetAll', 's',
+                ['org.freedesktop.systemd1.Manager'])[0]
+
+
+def get_property(path, interface, name, destination='org.freedesktop.systemd1'):
+    """Get a property of an object via org.freedesktop.DBus.Properties."""
+    _, value = call(path, 'org.freedesktop.DBus.Properties', 'Get', 'ss', [interface, name],
+                    destination=destination)[0]
+
+    return value
+
+
+def call(path, interface, member, signature='', args=(), destination='org.freedesktop.systemd1'):
+    """Call a method and return the list of values in its reply."""
+    conn = _connect()
+
+    fields = [(_PATH, ('o', path)),
+              (_INTERFACE, ('s', interface)),
+              (_MEMBER, ('s', member)),
+              (_DESTINATION, ('s', destination))]
+
+    if signature:
+        fields.append((_SIGNATURE, ('g', signature)))
+
+    try:
+        serial = _send(conn, _METHOD_CALL, fields, signature, args)
+
+        while True:
+            msg_type, headers, body = _receive(conn)
+
+            # Skip signals and replies not meant for us (e.g. NameAcquired).
+            if headers.get(_REPLY_SERIAL) == serial:
+                break
+    except (OSError, BusError):
+        # The connection is no good to us any more.
+        close()
+        raise
+
+    if msg_type == _ERROR:
+        message = body[0] if body and isinstance(body[0], str) else ''
+        raise BusError(f"{headers.get(_ERROR_NAME)}: {message}")
+
+    return body
+
+
+def close():
+    """Close the bus connection, if open."""
+    global _connection
+    global _connection_pid
+
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+        _connection_pid = None
+
+
+# Internal functions
+def _connect():
+    """Get the connection to the bottle's systemd, made by connect()."""
+    if _connection is None:
+        raise BusError("not connected to the bottle's systemd")
+
+    return _connection
+
+
+def _authenticate(sock):
+    """Perform EXTERNAL authentication as our effective uid."""
+    uid = str(os.geteuid()).encode().hex()
+    sock.sendall(b'\0AUTH EXTERNAL ' + uid.encode() + b'\r\n')
+
+    reply = b''
+    while not reply.endswith(b'\r\n'):
+        chunk = sock.recv(256)
+        if not chunk:
+            raise BusError("connection closed during authentication")
+        reply += chunk
+
+    if not reply.startswith(b'OK '):
+        raise BusError(f"authentication rejected: {reply.decode(errors='replace').strip()}")
+
+    sock.sendall(b'BEGIN\r\n')
+
+
+def _send(conn, msg_type, fields, signature, args):
+    """Marshal and send a message; returns its serial."""
+    global _serial
+
+    _serial += 1
+
+    body = bytearray()
+    _marshal(body, signature, args, '<')
+
+    header = bytearray()
+    _marshal(header, 'yyyyuua(yv)',
+             [ord('l'), msg_type, 0, 1, len(body), _serial, fields], '<')
+    _pad(header, 8)
+
+    conn.sendall(bytes(header) + bytes(body))
+
+    return _serial
+
+
+def _receive(conn):
+    """Receive and unmarshal one message; returns its type, header fields and body."""
+    fixed = _recv_exactly(conn, 16)
+
+    endian = '<' if fixed[0:1] == b'l' else '>'
+    msg_type = fixed[1]
+    body_length, _, fields_length = struct.unpack(endian + 'III', fixed[4:16])
+
+    header_length = 16 + fields_length
+    header_length += -header_length % 8
+
+    data = fixed + _recv_exactly(conn, header_length - 16 + body_length)
+
+    header_fields, _ = _unmarshal(data, 12, 'a(yv)', endian)
+    headers = {}
+    for code, (_, value) in header_fields[0]:
+        headers[code] = value
+
+    body = []
+    if _SIGNATURE in headers:
+        body, _ = _unmarshal(data[header_length:], 0, headers[_SIGNATURE], endian)
+
+    return msg_type, headers, body
+
+
+def _recv_exactly(conn, length):
+    """Receive exactly length bytes from the connection."""
+    data = bytearray()
+
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if not chunk:
+            raise BusError("connection closed by peer")
+        data += chunk
+
+    return bytes(data)
+
+
+def _pad(buf, alignment):
+    """Pad a buffer with zero bytes to the specified alignment."""
+    buf += b'\0' * (-len(buf) % alignment)
+
+
+def _split_signature(signature):
+    """Split a signature into a list of single complete types."""
+    types = []
+    i = 0
+
+    while i < len(signature):
+        start = i
+
+        while signature[i] == 'a':
+            i += 1
+
+        if signature[i] in '({':
+            depth = 0
+            while True:
+                if signature[i] in '({':
+                    depth += 1
+                elif signature[i] in ')}':
+                    depth -= 1
+                i += 1
+                if depth == 0:
+                    break
+        else:
+            i += 1
+
+        types.append(signature[start:i])
+
+    return types
+
+
+def _marshal(buf, signature, values, endian):
+    """Marshal a list of values according to a signature, appending to buf."""
+    for code, value in zip(_split_signature(signature), values):
+        _marshal_one(buf, code, value, endian)
+
+
+def _marshal_one(buf, code, value, endian):
+    """Marshal a single value of a single complete type."""
+    _pad(buf, _alignments[code[0]])
+
+    if code in _fixed:
+        buf += struct.pack(endian + _fixed[code], value)
+    elif code in 'so':
+        data = value.encode()
+        buf += struct.pack(endian + 'I', len(data)) + data + b'\0'
+    elif code == 'g':
+        data = value.encode()
+        buf += bytes([len(data)]) + data + b'\0'
+    elif code == 'v':
+        inner, inner_value = value
+        _marshal_one(buf, 'g', inner, endian)
+        _marshal_one(buf, inner, inner_value, endian)
+    elif code[0] == 'a':
+        length_at = len(buf)
+        buf += b'\0\0\0\0'
+        _pad(buf, _alignments[code[1]])
+        start = len(buf)
+
+        if code[1] == '{':
+            value = list(value.items())
+
+        for element in value:
+            _marshal_one(buf, code[1:], element, endian)
+
+        struct.pack_into(endian + 'I', buf, length_at, len(buf) - start)
+    elif code[0] in '({':
+        _marshal(buf, code[1:-1], value, endian)
+    else:
+        raise BusError(f"cannot marshal type '{code}'")
+
+
+def _unmarshal(data, offset, signature, endian):
+    """Unmarshal values according to a signature; returns the list of values and the new offset."""
+    values = []
+
+    for code in _split_signature(signature):
+        value, offset = _unmarshal_one(data, offset, code, endian)
+        values.append(value)
+
+    return values, offset
+
+
+def _unmarshal_one(data, offset, code, endian):
+    """Unmarshal a single value of a single complete type; returns the value and the new offset."""
+    offset += -offset % _alignments[code[0]]
+
+    if code in _fixed:
+        fmt = endian + _fixed[code]
+        value = struct.unpack_from(fmt, data, offset)[0]
+        return (bool(value) if code == 'b' else value), offset + struct.calcsize(fmt)
+
+    if code in 'so':
+        length = struct.unpack_from(endian + 'I', data, offset)[0]
+        offset += 4
+        return data[offset:offset + length].decode(errors='replace'), offset + length + 1
+
+    if code == 'g':
+        length = data[offset]
+        offset += 1
+        return data[offset:offset + length].decode(), offset + length + 1
+
+    if code == 'v':
+        inner, offset = _unmarshal_one(data, offset, 'g', endian)
+        value, offset = _unmarshal_one(data, offset, inner, endian)
+        return (inner, value), offset
+
+    if code[0] == 'a':
+        length = struct.unpack_from(endian + 'I', data, offset)[0]
+        offset += 4
+        offset += -offset % _alignments[code[1]]
+        end = offset + length
+
+        elements = []
+        while offset < end:
+            element, offset = _unmarshal_one(data, offset, code[1:], endian)
+            elements.append(element)
+
+        if code[1] == '{':
+            return dict(elements), offset
+
+        return elements, offset
+
+    if code[0] in '({':
+        value, offset = _unmarshal(data, offset, code[1:-1], endian)
+        return tuple(value), offset
+
+    raise BusError(f"cannot unmarshal type '{code}'")
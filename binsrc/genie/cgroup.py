@@ -0,0 +1,161 @@
+# Bottle cgroup module
+#
+# Confines the bottle to a cgroup of its own, with the cgroup v2 resource
+# limits configured in the [cgroup] section of genie.ini, so that a runaway
+# unit inside the bottle cannot take all of the WSL VM's CPU and memory. The
+# bottle's systemd is placed in the cgroup before it is executed, and runs its
+# own hierarchy below it.
+
+import errno
+import os
+
+import configuration
+
+# Global variables
+
+cgroup_root = '/sys/fs/cgroup'
+bottle_cgroup = os.path.join(cgroup_root, 'genie')
+
+# The limits which may be configured, named as their cgroup control files.
+limits = ['cpu.max', 'cpu.weight', 'memory.high', 'memory.max', 'io.weight', 'pids.max']
+
+
+# functions
+def configured():
+    """Get the configured limits, as a dict of control file names to values."""
+    return {name: configuration.cgroup_limit(name) for name in limits
+            if configuration.cgroup_limit(name) is not None}
+
+
+def exists():
+    """Determine whether the bottle's cgroup exists."""
+    return os.path.isdir(bottle_cgroup)
+
+
+def create(verbose):
+    """Create the bottle's cgroup with the configured limits; returns its path, or None if there are no limits to apply."""
+    wanted = configured()
+
+    if not wanted:
+        return None
+
+    try:
+        with open(os.path.join(cgroup_root, 'cgroup.controllers'), 'r') as controllersfile:
+            available = controllersfile.read().split()
+    except OSError:
+        print("genie: cgroup v2 is not available; attempting to continue without bottle resource limits")
+        return None
+
+    if verbose:
+        print(f"genie: creating bottle cgroup {bottle_cgroup}")
+
+    try:
+        os.makedirs(bottle_cgroup, exist_ok=True)
+    except OSError as e:
+        print(f"genie: failed to create bottle cgroup; attempting to continue without resource limits; {e.strerror}")
+        return None
+
+    for name, value in wanted.items():
+        controller = name.split('.')[0]
+
+        if controller not in available:
+            print(f"genie: cgroup controller '{controller}' is not available; attempting to continue without {name}")
+            continue
+
+        if verbose:
+            print(f"genie: setting bottle {name} to {value}")
+
+        try:
+            _write(os.path.join(cgroup_root, 'cgroup.subtree_control'), f'+{controller}')
+            _write(os.path.join(bottle_cgroup, name), value)
+        except OSError as e:
+            print(f"genie: failed to set bottle {name} to '{value}'; attempting to continue without it; {e.strerror}")
+
+    return bottle_cgroup
+
+
+def enter(path):
+    """Move this process into the cgroup at path."""
+    _write(os.path.join(path, 'cgroup.procs'), str(os.getpid()))
+
+
+def remove(verbose):
+    """Remove the bottle's cgroup, and those systemd created below it."""
+    if not exists():
+        if verbose:
+            print("genie: no bottle cgroup to remove")
+        return
+
+    if verbose:
+        print(f"genie: removing bottle cgroup {bottle_cgroup}")
+
+    try:
+        for dirpath, dirnames, filenames in os.walk(bottle_cgroup, topdown=False):
+            os.rmdir(dirpath)
+    except OSError as e:
+        if e.errno == errno.EBUSY:
+            print("genie: bottle cgroup still has processes in it; attempting to continue")
+        else:
+            print(f"genie: failed to remove bottle cgroup; attempting to continue; {e.strerror}")
+
+
+def usage():
+    """Get the bottle cgroup's resource usage and limits as a dict, or None if there is no bottle cgroup."""
+    if not exists():
+        return None
+
+    result = {'path': '/' + os.path.relpath(bottle_cgroup, cgroup_root)}
+
+    cpu = _read_keyed('cpu.stat')
+    result['cpu_usage_seconds'] = _seconds(cpu.get('usage_usec'))
+    result['cpu_throttled_seconds'] = _seconds(cpu.get('throttled_usec'))
+    result['memory_current'] = _read_int('memory.current')
+    result['pids_current'] = _read_int('pids.current')
+
+    # The limits in force, which are those configured unless setting them failed.
+    for name in limits:
+        result[name] = _read(name)
+
+    return result
+
+
+# Internal functions
+def _write(path, value):
+    """Write a value to a cgroup control file."""
+    fd = os.open(path, os.O_WRONLY)
+
+    try:
+        os.write(fd, value.encode())
+    finally:
+        os.close(fd)
+
+
+def _read(name):
+    """Read one of the bottle cgroup's control files, or None if it has no such file."""
+    try:
+        with open(os.path.join(bottle_cgroup, name), 'r') as controlfile:
+            return controlfile.read().strip()
+    except OSError:
+        return None
+
+
+def _read_int(name):
+    """Read one of the bottle cgroup's single-value control files as an integer, or None."""
+    value = _read(name)
+
+    return int(value) if value is not None and value.isdigit() else None
+
+
+def _read_keyed(name):
+    """Read one of the bottle cgroup's flat keyed control files as a dict."""
+    value = _read(name)
+
+    if value is None:
+        return {}
+
+    return dict(line.split(None, 1) for line in value.splitlines() if ' ' in line)
+
+
+def _seconds(usec):
+    """Convert a count of microseconds, as a string, to seconds, or None."""
+    return round(int(usec) / 1000000, 3) if usec is not None and usec.isdigit() else None
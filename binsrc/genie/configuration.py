@@ -8,6 +8,16 @@ _config = None
 
 
 # functions
+def broker():
+    """Start a broker process with the bottle to serve genie requests?"""
+    return _config.getboolean('genie', 'broker', fallback=False)
+
+
+def cgroup_limit(name):
+    """Get the configured value of a cgroup limit on the bottle (e.g. 'memory.max'), or None for no limit."""
+    return _config.get('cgroup', name, fallback='').strip() or None
+
+
 def clonable_envars():
     """Get the list of environment variables to clone."""
     return (_config.get('genie', 'clone-env',
@@ -19,6 +29,16 @@ def clone_path():
     return _config.getboolean('genie', 'clone-path', fallback=False)
 
 
+def command_scope():
+    """Run direct commands in a transient scope unit, or not?"""
+    return _config.getboolean('genie', 'command-scope', fallback=False)
+
+
+def metrics():
+    """Keep metrics of genie's operation, or not?"""
+    return _config.getboolean('genie', 'metrics', fallback=True)
+
+
 def resolved_stub():
     """Do we make the systemd-resolved stub, or not?"""
     return _config.getboolean('genie', 'resolved-stub', fallback=False)
@@ -0,0 +1,67 @@
+# Direct command execution module
+#
+# Runs commands in the bottle by entering its namespaces directly, rather than
+# opening a machinectl shell session (with its PAM session and pseudo-terminal).
+
+import os
+import pwd
+
+import configuration
+
+
+def command_line(sdp, user, cwd, commandline):
+    """Build the command line which runs commandline directly inside the bottle as user, in cwd."""
+    chain = ["nsenter", "--target", str(sdp), "--pid", "--mount", f"--wd={cwd}", "--"]
+
+    return chain + user_command_line(user, commandline)
+
+
+def user_command_line(user, commandline):
+    """Build the command line which runs commandline as user, once inside the bottle."""
+    pw = pwd.getpwnam(user)
+
+    chain = []
+
+    # If configured to, register the command as a transient scope unit.
+    if configuration.command_scope():
+        chain = chain + ["systemd-run", "--scope", "--quiet", "--collect", "--"]
+
+    if pw.pw_uid != 0:
+        chain = chain + ["setpriv", f"--reuid={pw.pw_uid}", f"--regid={pw.pw_gid}", "--init-groups", "--"]
+
+    return chain + commandline
+
+
+def environment(user):
+    """Build the environment for a command run directly inside the bottle as user."""
+    pw = pwd.getpwnam(user)
+
+    env = {}
+
+    # Start with the environment stashed when the bottle was initialized.
+    if os.path.exists('/run/genie.env'):
+        with open('/run/genie.env', 'r') as envfile:
+            for line in envfile:
+                name, sep, value = line.rstrip('\n').partition('=')
+                if sep:
+                    env[name] = value
+
+    # The path is the secure path, plus the stashed path, less duplicates.
+    paths = configuration.secure_path().split(':')
+
+    if os.path.exists('/run/genie.path'):
+        with open('/run/genie.path', 'r') as pathfile:
+            paths = paths + pathfile.read().strip().split(':')
+
+    env['PATH'] = ':'.join(dict.fromkeys(p for p in paths if p))
+
+    env['HOME'] = pw.pw_dir
+    env['USER'] = pw.pw_name
+    env['LOGNAME'] = pw.pw_name
+    env['SHELL'] = pw.pw_shell
+
+    for name in ('TERM', 'LANG'):
+        if name in os.environ:
+            env[name] = os.environ[name]
+
+    return env
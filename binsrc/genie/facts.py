@@ -0,0 +1,84 @@
+# Host facts cache module
+#
+# Facts about the host which cannot change without a reboot (are we on WSL 1,
+# where is unshare, is AppArmor in the kernel, etc.) are probed once, and then
+# cached in /run, keyed by the kernel's boot id.
+
+import _thread
+import os
+
+# Global variables
+
+facts_file = '/run/genie.facts'
+
+_facts = None
+
+# Init phases may look up facts concurrently. (The low-level lock avoids the
+# import cost of threading for commands which never start a thread.)
+_lock = _thread.RLock()
+
+
+# functions
+def get(name, probe):
+    """Get a host fact, calling probe to find it (and caching the result for this boot) if not already known."""
+    with _lock:
+        facts = _load()
+
+        if name in facts:
+            return facts[name]
+
+        value = probe()
+
+        # A probe which found nothing (returned None) may do better next time.
+        if value is not None:
+            facts[name] = value
+            _save()
+
+        return value
+
+
+def get_boot_id():
+    """Get the kernel's boot id."""
+    with open('/proc/sys/kernel/random/boot_id', 'r') as bootfile:
+        return bootfile.read().strip()
+
+
+# Internal functions
+def _load():
+    """Load the cached facts, discarding them if they are from a previous boot."""
+    global _facts
+
+    if _facts is not None:
+        return _facts
+
+    import json
+
+    boot_id = get_boot_id()
+
+    try:
+        with open(facts_file, 'r') as factsfile:
+            _facts = json.load(factsfile)
+    except (OSError, ValueError):
+        _facts = {}
+
+    if not isinstance(_facts, dict) or _facts.get('boot-id') != boot_id:
+        _facts = {'boot-id': boot_id}
+
+    return _facts
+
+
+def _save():
+    """Save the cached facts, atomically; if we cannot, we will simply probe again next time."""
+    import json
+
+    temp_file = f"{facts_file}.{os.getpid()}"
+
+    try:
+        with open(temp_file, 'w') as factsfile:
+            json.dump(_facts, factsfile)
+
+        os.chmod(temp_file, 0o644)
+        os.replace(temp_file, facts_file)
+    except OSError:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
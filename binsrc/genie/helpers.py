@@ -2,19 +2,58 @@
 
 import os
 import pwd
-import shutil
-import subprocess
 import sys
 
-import nsenter
-import psutil
+# Heavier modules are imported by the functions which use them, so that
+# commands which do not need them do not pay for them at startup.
+import bottle
+import facts
 
 
 def find_systemd():
     """Find the running systemd process and return its pid."""
-    for proc in psutil.process_iter():
-        if "systemd" in proc.name():
-            return proc.pid
+    sdp = bottle.lookup()
+
+    if sdp != 0:
+        return sdp
+
+    # If there is no registry, no pid file, and no initialization in progress,
+    # there is no bottle, and no need to go looking for one.
+    if not (os.path.exists(bottle.registry_file)
+            or os.path.exists('/run/genie.systemd.pid')
+            or os.path.exists('/run/genie.init.lock')):
+        return 0
+
+    # Registry is stale or not yet written; fall back to a full scan.
+    sdp = scan_for_systemd()
+
+    if sdp == 0:
+        if os.path.exists(bottle.registry_file):
+            bottle.forget()
+    elif sdp != 1:
+        bottle.record(sdp)
+
+    return sdp
+
+
+def scan_for_systemd():
+    """Scan all processes for a systemd which is pid 1 in its own namespace, and return its pid."""
+    import psutil
+
+    for proc in psutil.process_iter(['name']):
+        if proc.info['name'] != "systemd":
+            continue
+
+        # Exclude user instances of systemd; the bottle's systemd is pid 1 in its namespace.
+        try:
+            with open(f'/proc/{proc.pid}/status', 'r') as statusfile:
+                for line in statusfile:
+                    if line.startswith('NSpid:'):
+                        if line.split()[-1] == '1':
+                            return proc.pid
+                        break
+        except OSError:
+            continue
 
     return 0
 
@@ -25,26 +64,66 @@ def get_login_session_user():
     return os.environ["GENIE_LOGNAME"]
 
 
+def get_root_fstype():
+    """Get the filesystem type of the root filesystem."""
+    # As psutil.disk_partitions would, but without needing to import psutil.
+    with open('/proc/self/mounts', 'r') as mounts:
+        for line in mounts:
+            fields = line.split()
+            if len(fields) >= 3 and fields[1] == '/':
+                return fields[2]
+
+    return None
+
+
 def get_systemd_state(sdp):
     """Get the systemd state, whether we are within or without the bottle."""
+    import busclient
 
     if sdp == 0:
         return "offline"
 
-    with nsenter.Namespace(sdp, 'pid'):
+    # Ask systemd directly over its bus socket, if we can.
+    try:
+        busclient.connect(sdp)
+        return busclient.get_manager_property('SystemState')
+    except (OSError, busclient.BusError):
+        pass
+
+    import subprocess
+
+    import namespaces
+
+    with namespaces.enter(sdp, 'pid'):
         sc = subprocess.run(["systemctl", "is-system-running"],
                             capture_output=True, text=True)
         return sc.stdout.rstrip()
 
 
+def get_systemd_failed_units_count(sdp):
+    """Get the number of failed systemd units, or None if it cannot be determined."""
+    import busclient
+
+    if sdp == 0:
+        return None
+
+    try:
+        busclient.connect(sdp)
+        return busclient.get_manager_property('NFailedUnits')
+    except (OSError, busclient.BusError):
+        return None
+
+
 def get_systemd_target():
-    """Get the default systemd target."""
+    """Get the default systemd target (not cached, since systemctl set-default changes it)."""
     return os.path.basename(os.path.realpath('/etc/systemd/system/default.target'))
 
 
 def get_unshare_path():
     """Find the path to the unshare utility."""
-    return shutil.which('unshare')
+    import shutil
+
+    return facts.get('unshare-path', lambda: shutil.which('unshare'))
 
 
 def get_wsl_distro_name():
@@ -60,15 +139,13 @@ def prelaunch_checks():
         sys.exit("genie: not executing on the Linux platform - how did we get here?")
 
     # Is this WSL 1?
-    root_type = list(filter(lambda x: x.mountpoint == '/',
-                            psutil.disk_partitions(all=True)))[0].fstype
+    root_type = facts.get('root-fstype', get_root_fstype)
     if root_type == 'lxfs' or root_type == 'wslfs':
         sys.exit("genie: systemd is not supported under WSL 1.")
 
     # Is this WSL 2?
-    if not os.path.exists('/run/WSL'):
-        if 'microsoft' not in os.uname().release:
-            sys.exit("genie: not executing under WSL 2 - how did we get here?")
+    if not facts.get('wsl2', lambda: os.path.exists('/run/WSL') or 'microsoft' in os.uname().release):
+        sys.exit("genie: not executing under WSL 2 - how did we get here?")
 
     # Are we effectively root?
     if os.geteuid() != 0:
@@ -1,12 +1,20 @@
 # Hostname and hosts file functions module
 
+import errno
 import os
-import subprocess
+import re
 import sys
 
-from python_hosts import Hosts, HostsEntry
-
 import configuration
+import syscalls
+
+# Global variables
+
+hosts_file = '/etc/hosts'
+
+_whitespace = re.compile(rb'(\s+)')
+
+_block_size = 64 * 1024
 
 
 def update(verbose):
@@ -39,10 +47,9 @@ def update(verbose):
     if verbose:
         print(f"genie: setting new hostname to {internal_hostname}")
 
-    sp = subprocess.run(
-        ['mount', '--bind', '/run/genie.hostname', '/etc/hostname'])
-
-    if sp.returncode != 0:
+    try:
+        syscalls.mount('/run/genie.hostname', '/etc/hostname', flags=syscalls.MS_BIND)
+    except OSError:
         print("genie: failed to bind hostname file; attempting to continue")
         return
 
@@ -61,9 +68,9 @@ def restore(verbose):
         print("genie: dropping in-bottle hostname")
 
     # Drop the in-bottle hostname mount
-    sp = subprocess.run(['umount', '/etc/hostname'])
-
-    if sp.returncode != 0:
+    try:
+        syscalls.umount('/etc/hostname')
+    except OSError:
         print("genie: failed to unmount hostname file; attempting to continue")
         return
 
@@ -71,7 +78,10 @@ def restore(verbose):
     os.remove('/run/genie.hostname')
 
     # Reset hostname
-    subprocess.run(['hostname', '-F', '/etc/hostname'])
+    try:
+        _set_hostname_from_file('/etc/hostname')
+    except OSError as e:
+        print(f"genie: failed to reset hostname; attempting to continue; {e.strerror}")
 
     external_hostname = os.uname().nodename
 
@@ -79,29 +89,161 @@ def restore(verbose):
     _modify_hosts_file_entries(internal_hostname, external_hostname)
 
 
+def rename_in_hosts_file(old_name, new_name, path=hosts_file):
+    """Replace old_name with new_name in the entries of a hosts file which have it as a name; returns True if anything changed."""
+    old = os.fsencode(old_name)
+    new = os.fsencode(new_name)
+
+    # Stream through the file a block of whole lines at a time, only starting a
+    # new file at the first change, and writing nothing at all if there is none.
+    temp = None
+    offset = 0
+
+    with open(path, 'rb') as hosts:
+        try:
+            remainder = b''
+
+            while True:
+                chunk = hosts.read(_block_size)
+                block = remainder + chunk
+
+                if chunk:
+                    end = block.rfind(b'\n') + 1
+                    block, remainder = block[:end], block[end:]
+                elif not block:
+                    break
+
+                replacement = _rename_in_block(block, old, new)
+
+                if temp is None and replacement is not block:
+                    temp = _start_rewrite(path, offset)
+
+                if temp is not None:
+                    temp.write(replacement)
+                else:
+                    offset += len(block)
+
+                if not chunk:
+                    break
+
+            if temp is None:
+                return False
+
+            _finish_rewrite(path, temp)
+            return True
+        finally:
+            # Clean up after any failure.
+            if temp is not None:
+                temp.close()
+                if os.path.exists(temp.name):
+                    os.remove(temp.name)
+
+
 # Internal functions
+def _set_hostname_from_file(path):
+    """Set the hostname from the first line of a file which is neither blank nor a comment, as hostname -F does."""
+    with open(path, 'r') as hostfile:
+        for line in hostfile:
+            name = line.strip()
+
+            if name and not name.startswith('#'):
+                syscalls.sethostname(name)
+                return
+
+    raise OSError(errno.EINVAL, f"no hostname in {path}")
+
+
 def _modify_hosts_file_entries(old_name, new_name):
     """Modify the hosts file to replace old_name with new_name."""
     try:
-        hosts = Hosts()
+        rename_in_hosts_file(old_name, new_name)
+    except (OSError, UnicodeError) as e:
+        print(f"genie: error occurred modifying hosts file ({e}); check format")
+        print("genie: attempting to continue anyway...")
 
-        entries = hosts.find_all_matching(name=old_name)
 
-        # Iterate through all relevant entries
-        for e in entries:
-            # Iterate through all names
-            new_names = []
-            for n in e.names:
-                # Modify name
-                new_names.append(n.replace(old_name, new_name))
-                new_entry = HostsEntry(
-                    entry_type=e.entry_type, address=e.address, names=new_names, comment=e.comment)
+def _rename_in_block(block, old, new):
+    """Rename old to new in a block of whole hosts file lines; returns the block itself if nothing changed."""
+    # Almost every block of a large hosts file can be passed over without parsing.
+    if old not in block:
+        return block
 
-                # Replace old entry
-                hosts.add([new_entry], force=True)
+    lines = block.splitlines(keepends=True)
+    replacements = [_rename_in_line(line, old, new) for line in lines]
 
-        hosts.write()
+    if all(r is line for r, line in zip(replacements, lines)):
+        return block
 
-    except:  # noqa
-        print(f"genie: error occurred modifying hosts file ({sys.exc_info()[0]}); check format")
-        print("genie: attempting to continue anyway...")
+    return b''.join(replacements)
+
+
+def _rename_in_line(line, old, new):
+    """Rename old to new in a hosts file line, if it is one of the line's names; otherwise returns the line itself."""
+    if old not in line:
+        return line
+
+    entry, hash, comment = line.partition(b'#')
+
+    # Tokens alternate with the whitespace between them, which is kept as is.
+    tokens = _whitespace.split(entry)
+    fields = [t for t in tokens[::2] if t]
+
+    # The first field is the address; the rest are names.
+    if old not in fields[1:]:
+        return line
+
+    start = 0 if tokens[0] else 2
+    for i in range(start + 2, len(tokens), 2):
+        tokens[i] = tokens[i].replace(old, new)
+
+    return b''.join(tokens) + hash + comment
+
+
+def _start_rewrite(path, length):
+    """Start a replacement for the file at path, beside it, with the first length bytes of the original."""
+    directory, name = os.path.split(os.path.realpath(path))
+    temp = open(os.path.join(directory, f".{name}.genie-{os.getpid()}"), 'wb')
+
+    try:
+        with open(path, 'rb') as original:
+            while length > 0:
+                chunk = original.read(min(length, 65536))
+                if not chunk:
+                    break
+                temp.write(chunk)
+                length -= len(chunk)
+    except OSError:
+        temp.close()
+        os.remove(temp.name)
+        raise
+
+    return temp
+
+
+def _finish_rewrite(path, temp):
+    """Put the replacement in place of the original atomically, with its mode and ownership."""
+    target = os.path.realpath(path)
+    st = os.stat(target)
+
+    os.fchmod(temp.fileno(), st.st_mode & 0o7777)
+    os.fchown(temp.fileno(), st.st_uid, st.st_gid)
+    temp.flush()
+    os.fsync(temp.fileno())
+    temp.close()
+
+    try:
+        os.replace(temp.name, target)
+    except OSError as e:
+        # A bind-mounted hosts file cannot be replaced; overwrite it instead.
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+
+        with open(temp.name, 'rb') as source, open(target, 'r+b') as destination:
+            while True:
+                chunk = source.read(65536)
+                if not chunk:
+                    break
+                destination.write(chunk)
+            destination.truncate()
+
+        os.remove(temp.name)
@@ -0,0 +1,182 @@
+# Metrics module
+#
+# Keeps cumulative counters and histograms of genie's own operation (bottle
+# initialization and shutdown, and command dispatch) in a small file in /run,
+# updated under a lock by each invocation of genie, and renders them in the
+# Prometheus text exposition format, e.g. for node_exporter's textfile collector.
+
+import fcntl
+import json
+import os
+
+import configuration
+
+# Global variables
+
+metrics_file = '/run/genie.metrics'
+
+# Histogram buckets, in seconds, for things which take milliseconds...
+_fast_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# ...and for things which take seconds.
+_slow_buckets = [0.5, 1, 2.5, 5, 10, 15, 30, 60, 120, 240, 480]
+
+# Metric names, with their type, help text, and buckets (for histograms).
+_definitions = {
+    'genie_init_phase_duration_seconds':
+        ('histogram', "Time taken by each phase of bottle initialization.", _fast_buckets),
+    'genie_boot_seconds':
+        ('histogram', "Time from starting systemd to its reporting that it is ready.", _slow_buckets),
+    'genie_shutdown_seconds':
+        ('histogram', "Time from asking systemd to power off to its exiting.", _slow_buckets),
+    'genie_command_dispatch_seconds':
+        ('histogram', "Time from genie starting to its running the command, by mode.", _fast_buckets),
+    'genie_inits_total':
+        ('counter', "Bottle initializations, by outcome.", None),
+    'genie_init_timeouts_total':
+        ('counter', "Bottle initializations in which systemd did not become ready in time.", None),
+    'genie_degraded_boots_total':
+        ('counter', "Bottle initializations in which systemd became ready in degraded state.", None),
+    'genie_shutdown_timeouts_total':
+        ('counter', "Bottle shutdowns in which systemd did not exit in time.", None),
+}
+
+
+# functions
+def count(name, labels=None):
+    """Increment a counter."""
+    record(counts=[(name, labels)])
+
+
+def observe(name, value, labels=None):
+    """Add an observation to a histogram."""
+    record(observations=[(name, labels, value)])
+
+
+def record(counts=(), observations=()):
+    """Increment the (name, labels) counters and add the (name, labels, value) observations to histograms, all at once."""
+    if not configuration.metrics():
+        return
+
+    # Metrics are never worth failing over.
+    try:
+        fd = os.open(metrics_file, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        return
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        data = _read(fd)
+
+        for name, labels in counts:
+            series = data.setdefault(name, {})
+            key = _label_string(labels)
+            series[key] = series.get(key, 0) + 1
+
+        for name, labels, value in observations:
+            buckets = _definitions[name][2]
+            series = data.setdefault(name, {})
+            key = _label_string(labels)
+
+            if key not in series:
+                series[key] = {'buckets': [0] * len(buckets), 'sum': 0, 'count': 0}
+
+            histogram = series[key]
+
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+        text = json.dumps(data).encode()
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, text)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def render():
+    """Render the metrics in the Prometheus text exposition format."""
+    try:
+        fd = os.open(metrics_file, os.O_RDONLY)
+    except OSError:
+        data = {}
+    else:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            data = _read(fd)
+        finally:
+            os.close(fd)
+
+    lines = []
+
+    for name, (kind, help_text, buckets) in _definitions.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        for key, value in sorted(data.get(name, {}).items()):
+            if kind == 'counter':
+                lines.append(f"{name}{_braces(key)} {value}")
+                continue
+
+            cumulative = 0
+
+            for bound, bucket in zip(buckets, value['buckets']):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_braces(_join(key, _label_string({'le': bound})))} {cumulative}")
+
+            lines.append(f"{name}_bucket{_braces(_join(key, _label_string({'le': '+Inf'})))} {value['count']}")
+            lines.append(f"{name}_sum{_braces(key)} {value['sum']:.6f}")
+            lines.append(f"{name}_count{_braces(key)} {value['count']}")
+
+    return '\n'.join(lines) + '\n'
+
+
+# Internal functions
+def _read(fd):
+    """Read the metrics data from the (locked) file; an unreadable file starts afresh."""
+    chunks = []
+
+    os.lseek(fd, 0, os.SEEK_SET)
+
+    while True:
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+    try:
+        data = json.loads(b''.join(chunks) or b'{}')
+    except ValueError:
+        return {}
+
+    return data if isinstance(data, dict) else {}
+
+
+def _label_string(labels):
+    """Render a dict of labels as the inside of a Prometheus label set."""
+    if not labels:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return ','.join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items()))
+
+
+def _join(key, label):
+    """Add a label to a rendered label set."""
+    return f"{key},{label}" if key else label
+
+
+def _braces(key):
+    """Wrap a rendered label set in braces, if it is not empty."""
+    return f"{{{key}}}" if key else ''
@@ -0,0 +1,101 @@
+# Namespaces module
+#
+# Enters the namespaces of the bottle's systemd, and returns to our own
+# afterwards. Where the kernel supports it (Linux 5.8 and later), all the
+# namespaces are entered with a single setns() call on the pidfd held for the
+# bottle's systemd for the whole invocation; otherwise, with one setns() call
+# per namespace, on the files in /proc/<pid>/ns.
+
+import contextlib
+import errno
+import os
+
+import bottle
+import syscalls
+
+# Global variables
+
+# Namespace types, as named in /proc/<pid>/ns, and their CLONE_NEW* flags.
+_flags = {
+    'cgroup': 0x02000000,
+    'ipc': 0x08000000,
+    'mnt': 0x00020000,
+    'net': 0x40000000,
+    'pid': 0x20000000,
+    'uts': 0x04000000,
+}
+
+# Whether setns() accepts a pidfd; None until we have tried.
+_pidfd_setns = None
+
+
+# functions
+@contextlib.contextmanager
+def enter(sdp, *types):
+    """Enter the specified namespaces (e.g. 'pid', 'mnt') of the process sdp for the duration of the block."""
+    for t in types:
+        if t not in _flags:
+            raise ValueError(f"unsupported namespace type '{t}'")
+
+    # Keep hold of our own namespaces, to return to them afterwards.
+    own = [(t, os.open(f'/proc/self/ns/{t}', os.O_RDONLY | os.O_CLOEXEC)) for t in types]
+
+    try:
+        # Return to those we left, even if not all of them were entered.
+        try:
+            _enter(sdp, types)
+            yield
+        finally:
+            for t, fd in own:
+                if _left(t, fd):
+                    syscalls.setns(fd, _flags[t])
+    finally:
+        for t, fd in own:
+            os.close(fd)
+
+
+# Internal functions
+def _left(nstype, fd):
+    """Determine whether we have left our own namespace of the specified type, referred to by fd."""
+    # Entering a pid namespace changes only that of our future children.
+    name = 'pid_for_children' if nstype == 'pid' else nstype
+
+    try:
+        return os.stat(f'/proc/self/ns/{name}').st_ino != os.fstat(fd).st_ino
+    except OSError:
+        return True
+
+
+def _enter(sdp, types):
+    """Enter the specified namespaces of the process sdp."""
+    global _pidfd_setns
+
+    if _pidfd_setns is not False:
+        fd = bottle.pidfd(sdp)
+
+        if fd is not None:
+            flags = 0
+            for t in types:
+                flags |= _flags[t]
+
+            try:
+                syscalls.setns(fd, flags)
+                _pidfd_setns = True
+                return
+            except OSError as e:
+                # Kernels before 5.8 have pidfds, but do not accept them here.
+                if e.errno != errno.EINVAL or _pidfd_setns:
+                    raise
+
+            _pidfd_setns = False
+
+    # Open all the namespaces before entering any, since once in the bottle's
+    # mount namespace, its /proc has no process sdp.
+    fds = [(t, os.open(f'/proc/{sdp}/ns/{t}', os.O_RDONLY | os.O_CLOEXEC)) for t in types]
+
+    try:
+        for t, fd in fds:
+            syscalls.setns(fd, _flags[t])
+    finally:
+        for t, fd in fds:
+            os.close(fd)
@@ -0,0 +1,72 @@
+# systemd readiness notification module
+
+import os
+import select
+import socket
+import struct
+import time
+
+# Global variables
+
+notify_socket_path = '/run/genie.notify'
+
+
+# functions
+def open_socket():
+    """Create the notification socket to be passed to systemd as $NOTIFY_SOCKET; returns None on failure."""
+    if os.path.lexists(notify_socket_path):
+        os.remove(notify_socket_path)
+
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_PASSCRED, 1)
+        sock.bind(notify_socket_path)
+    except OSError as e:
+        print(f"genie: could not create notification socket ({e.strerror}); falling back to polling")
+        return None
+
+    return sock
+
+
+def close_socket(sock):
+    """Close and remove the notification socket."""
+    sock.close()
+
+    if os.path.lexists(notify_socket_path):
+        os.remove(notify_socket_path)
+
+
+def wait_ready(sock, timeout, progress=None):
+    """Wait for systemd to send READY=1; returns its (external) pid, or 0 on timeout."""
+    deadline = time.monotonic() + timeout
+    ucred_size = struct.calcsize('3i')
+
+    while True:
+        remaining = deadline - time.monotonic()
+
+        if remaining <= 0:
+            return 0
+
+        readable, _, _ = select.select([sock], [], [], remaining)
+
+        if not readable:
+            return 0
+
+        msg, ancdata, _, _ = sock.recvmsg(4096, socket.CMSG_SPACE(ucred_size))
+
+        # The kernel translates the sender's pid into our namespace, giving us the
+        # external pid of the bottle's systemd.
+        pid = 0
+        for level, type, data in ancdata:
+            if level == socket.SOL_SOCKET and type == socket.SCM_CREDENTIALS:
+                pid, _, _ = struct.unpack('3i', data[:ucred_size])
+
+        fields = msg.decode(errors='replace').split('\n')
+
+        if progress is not None:
+            for f in fields:
+                if f.startswith('STATUS='):
+                    progress(f[7:])
+
+        if 'READY=1' in fields and pid != 0:
+            return pid
@@ -0,0 +1,76 @@
+# Concurrent output module
+#
+# Init phases and teardown steps run on threads, and print as they go. While
+# they run, standard output is replaced by a stand-in which keeps what each of
+# them prints apart, so that it can be shown whole, one at a time, rather than
+# interleaved mid-line.
+
+import contextlib
+import sys
+import threading
+
+
+# functions
+@contextlib.contextmanager
+def collecting():
+    """Replace standard output, for the duration of the block, with one which can collect what each thread prints."""
+    collector = _Collector(sys.stdout)
+    sys.stdout = collector
+
+    try:
+        yield
+    finally:
+        sys.stdout = collector.stream
+
+
+@contextlib.contextmanager
+def collected(outputs, name):
+    """Collect what this thread prints during the block, into outputs[name], rather than printing it."""
+    collector = sys.stdout
+
+    if not isinstance(collector, _Collector):
+        yield
+        return
+
+    buffer = []
+    collector.local.buffer = buffer
+
+    try:
+        yield
+    finally:
+        collector.local.buffer = None
+        outputs[name] = ''.join(buffer)
+
+
+def show(outputs, name):
+    """Print what was collected under name, if anything."""
+    text = outputs.pop(name, '')
+
+    if text:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+# Internal functions
+class _Collector:
+    """A stand-in for standard output which collects what threads print, while they ask it to."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+
+        if buffer is None:
+            return self.stream.write(text)
+
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
@@ -0,0 +1,168 @@
+# Init phase executor module
+#
+# Bottle initialization is expressed as named phases, each with the names of
+# the phases it depends on. Each phase runs, on a thread pool, as soon as all
+# of its dependencies have completed, so that independent phases (which mostly
+# wait on mount and friends) overlap. A phase is a function taking the dict of
+# results of the phases completed so far, and returning its own result. What a
+# phase prints is shown, whole, once it has completed.
+
+import sys
+import time
+
+
+# functions
+def run(phases, verbose):
+    """Run the (name, function, dependencies) phases; returns their results and durations by name, or exits if any failed."""
+    import concurrent.futures
+
+    import output
+    import spans
+
+    order = plan(phases)
+    functions = {name: function for name, function, _ in phases}
+    dependencies = {name: set(deps) for name, _, deps in phases}
+
+    results = {}
+    durations = {}
+    failures = {}
+    skipped = []
+    started = set()
+    outputs = {}
+
+    def timed(name, completed):
+        start = time.monotonic()
+        with output.collected(outputs, name), spans.span(f'initialize.phases.{name}'):
+            result = functions[name](completed)
+        return result, time.monotonic() - start
+
+    with output.collecting(), concurrent.futures.ThreadPoolExecutor(max_workers=len(phases)) as executor:
+        running = {}
+
+        while True:
+            # Start every phase whose dependencies are all done, and skip those
+            # which depend on a failure.
+            for name in order:
+                if name in started:
+                    continue
+
+                if dependencies[name] & (set(failures) | set(skipped)):
+                    started.add(name)
+                    skipped.append(name)
+                elif dependencies[name] <= set(results):
+                    started.add(name)
+                    running[executor.submit(timed, name, dict(results))] = name
+
+            if not running:
+                break
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+
+                output.show(outputs, name)
+
+                try:
+                    results[name], durations[name] = future.result()
+                except SystemExit as e:
+                    failures[name] = e.code if isinstance(e.code, str) else f"exit code = {e.code}"
+                except Exception as e:
+                    failures[name] = f"{type(e).__name__}: {e}"
+
+    if verbose:
+        for name in order:
+            if name in durations:
+                print(f"genie: init phase '{name}' took {durations[name]:.3f}s")
+
+        path, length = critical_path(phases, durations)
+        print(f"genie: init critical path: {' -> '.join(path)} ({length:.3f}s)")
+
+    if failures:
+        for name in order:
+            if name in failures:
+                print(f"genie: init phase '{name}' failed: {failures[name]}")
+            elif name in skipped:
+                print(f"genie: init phase '{name}' skipped, since a phase it depends on failed")
+
+        sys.exit("genie: could not initialize bottle")
+
+    return results, durations
+
+
+def plan(phases):
+    """Check the phases' dependencies, and order them so that each follows its dependencies."""
+    names = [name for name, _, _ in phases]
+    dependencies = {name: list(deps) for name, _, deps in phases}
+
+    for name in names:
+        for dep in dependencies[name]:
+            if dep not in dependencies:
+                raise ValueError(f"phase '{name}' depends on unknown phase '{dep}'")
+
+    order = []
+
+    while len(order) < len(names):
+        ready = [name for name in names
+                 if name not in order and all(dep in order for dep in dependencies[name])]
+
+        if not ready:
+            raise ValueError("phase dependencies are circular: "
+                             + ', '.join(name for name in names if name not in order))
+
+        order.extend(ready)
+
+    return order
+
+
+def stages(phases):
+    """Group the phases into stages; each phase is in the stage after the latest of its dependencies."""
+    dependencies = {name: deps for name, _, deps in phases}
+    stage = {}
+
+    for name in plan(phases):
+        stage[name] = 1 + max((stage[dep] for dep in dependencies[name]), default=0)
+
+    return [[name for name in stage if stage[name] == n] for n in range(1, max(stage.values(), default=0) + 1)]
+
+
+def critical_path(phases, durations=None):
+    """Find the longest chain of dependent phases, weighted by durations (or by count); returns it and its length."""
+    dependencies = {name: deps for name, _, deps in phases}
+    finish = {}
+    previous = {}
+
+    for name in plan(phases):
+        before = max(dependencies[name], key=lambda dep: finish[dep], default=None)
+
+        previous[name] = before
+        finish[name] = (finish[before] if before is not None else 0) + \
+            (durations.get(name, 0) if durations is not None else 1)
+
+    if not finish:
+        return [], 0
+
+    name = max(finish, key=lambda n: finish[n])
+    length = finish[name]
+
+    path = []
+    while name is not None:
+        path.insert(0, name)
+        name = previous[name]
+
+    return path, length
+
+
+def print_plan(phases):
+    """Print the phases by stage, with their dependencies, and the critical path."""
+    dependencies = {name: deps for name, _, deps in phases}
+
+    print("genie: bottle initialization plan:")
+
+    for number, stage in enumerate(stages(phases), 1):
+        for name in stage:
+            after = f" (after {', '.join(dependencies[name])})" if dependencies[name] else ''
+            print(f"  stage {number}: {name}{after}")
+
+    path, length = critical_path(phases)
+    print(f"  critical path: {' -> '.join(path)} ({length} phases)")
@@ -0,0 +1,156 @@
+# Span tracing module
+#
+# Times the steps of bottle initialization, shutdown and command dispatch as
+# spans (name, start, duration, outcome, pid). The spans of each invocation are
+# appended, all at once as it finishes, to a JSON-lines log in /run, rotated when
+# it grows too large, and with --trace, shown as a waterfall on stderr.
+
+import atexit
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Global variables
+
+log_file = '/run/genie.spans'
+
+# Rotate the log, keeping one old one, beyond this size.
+log_size = 1024 * 1024
+
+# Show a waterfall of the spans on stderr?
+show = False
+
+_spans = []
+_lock = threading.Lock()
+_finished = False
+
+
+# functions
+@contextlib.contextmanager
+def span(name):
+    """Time the enclosed block as a span."""
+    start = time.time()
+    begin = time.monotonic()
+    outcome = 'ok'
+
+    try:
+        yield
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            outcome = 'failed'
+        raise
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        with _lock:
+            _spans.append({'name': name, 'start': round(start, 6),
+                           'duration': round(time.monotonic() - begin, 6),
+                           'outcome': outcome, 'pid': os.getpid(),
+                           'thread': threading.get_ident()})
+
+
+def reset():
+    """Forget the spans recorded so far, e.g. in a process forked to carry out a request of its own."""
+    global _finished
+
+    with _lock:
+        del _spans[:]
+
+    _finished = False
+
+
+def finish():
+    """Log this invocation's spans, and show them if asked to; called on exit, and before replacing this process."""
+    global _finished
+
+    if _finished:
+        return
+
+    _finished = True
+
+    with _lock:
+        spans = sorted(_spans, key=lambda s: s['start'])
+
+    if not spans:
+        return
+
+    _write_log(spans)
+
+    if show:
+        _print_waterfall(spans)
+
+
+# Internal functions
+def _write_log(spans):
+    """Append the spans to the log, rotating it if need be; never fails."""
+    import fcntl
+
+    text = ''.join(json.dumps({k: v for k, v in s.items() if k != 'thread'}) + '\n' for s in spans).encode()
+
+    try:
+        while True:
+            fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+            # Another invocation may have rotated the log while we waited for it.
+            try:
+                if os.stat(log_file).st_ino == os.fstat(fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+
+            os.close(fd)
+
+        try:
+            if os.fstat(fd).st_size + len(text) > log_size:
+                os.replace(log_file, log_file + '.1')
+
+                os.close(fd)
+                fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+            os.write(fd, text)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def _print_waterfall(spans):
+    """Show the spans on stderr as a waterfall."""
+    width = 40
+
+    origin = spans[0]['start']
+    end = max(s['start'] + s['duration'] for s in spans)
+    total = max(end - origin, 1e-6)
+
+    # Indent each span under those which enclose it: in time, and either in the
+    # same thread or by name (as 'a' encloses 'a.b').
+    def encloses(outer, inner):
+        return (outer is not inner and outer['start'] <= inner['start']
+                and outer['start'] + outer['duration'] >= inner['start'] + inner['duration']
+                and (outer['thread'] == inner['thread'] or inner['name'].startswith(outer['name'] + '.')))
+
+    def depth(inner):
+        return sum(1 for outer in spans if encloses(outer, inner))
+
+    names = [' ' * 2 * depth(s) + s['name'] for s in spans]
+    name_width = max(len(n) for n in names)
+
+    print(f"genie: trace of pid {os.getpid()}, {total * 1000:.1f} ms in all:", file=sys.stderr)
+
+    for name, s in zip(names, spans):
+        offset = s['start'] - origin
+        first = min(width - 1, int(offset / total * width))
+        last = max(first + 1, min(width, round((offset + s['duration']) / total * width)))
+
+        bar = ' ' * first + '=' * (last - first) + ' ' * (width - last)
+
+        print(f"  {name:{name_width}} |{bar}| {offset * 1000:8.1f} ms {s['duration'] * 1000:8.1f} ms  {s['outcome']}",
+              file=sys.stderr)
+
+
+atexit.register(finish)
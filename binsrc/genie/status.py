@@ -0,0 +1,143 @@
+# Bottle status module
+#
+# Collects everything a health check wants to know about the bottle in one
+# pass: two calls over the bus to the bottle's systemd (one for the manager's
+# properties, one for its units), plus a few reads from /proc and from the
+# bottle's cgroup, without forking systemctl or entering the bottle's namespaces.
+
+import os
+
+import bottle
+import busclient
+import cgroup
+
+
+# functions
+def collect(sdp):
+    """Collect the status of the bottle whose systemd has the specified pid (or 0, or 1 inside it); returns a dict."""
+    status = {
+        'state': 'stopped',
+        'systemd_state': 'offline',
+        'inside_bottle': sdp == 1,
+        'pid_outside': None,
+        'pid_inside': None,
+        'uptime': None,
+        'boot_duration': None,
+        'failed_units': None,
+        'sessions': None,
+        'cgroup': None,
+    }
+
+    if sdp == 0:
+        return status
+
+    # Inside the bottle, the external pid is only known from the registry.
+    if sdp == 1:
+        reg = bottle.load()
+        status['pid_outside'] = reg[0] if reg is not None else None
+    else:
+        status['pid_outside'] = sdp
+
+    status['pid_inside'] = 1
+    status['uptime'] = _uptime(sdp)
+    status['cgroup'] = cgroup.usage()
+
+    try:
+        busclient.connect(sdp)
+        properties = busclient.get_manager_properties()
+        units = busclient.call('/org/freedesktop/systemd1', 'org.freedesktop.systemd1.Manager', 'ListUnits')[0]
+    except (OSError, busclient.BusError):
+        # No bus; fall back to asking systemctl for the state alone.
+        import helpers
+
+        status['systemd_state'] = helpers.get_systemd_state(sdp)
+        status['state'] = state_name(status['systemd_state'])
+        return status
+
+    status['systemd_state'] = properties['SystemState'][1]
+    status['state'] = state_name(status['systemd_state'])
+
+    # Boot duration is from systemd starting to its reaching the default target.
+    started = properties.get('UserspaceTimestampMonotonic', ('t', 0))[1]
+    finished = properties.get('FinishTimestampMonotonic', ('t', 0))[1]
+
+    if started and finished:
+        status['boot_duration'] = round((finished - started) / 1000000, 3)
+
+    # Units are (name, description, load state, active state, sub state, ...).
+    status['failed_units'] = sorted(u[0] for u in units if u[3] == 'failed')
+    status['sessions'] = sum(1 for u in units if u[0].startswith('session-') and u[0].endswith('.scope')
+                             and u[3] == 'active')
+
+    return status
+
+
+def state_name(systemd_state):
+    """Get the bottle state corresponding to a systemd state."""
+    for name in ('running', 'degraded', 'stopping'):
+        if name in systemd_state:
+            return name
+
+    if 'initializing' in systemd_state or 'starting' in systemd_state:
+        return 'starting'
+
+    if systemd_state == 'offline':
+        return 'stopped'
+
+    return 'unknown'
+
+
+def exit_status(state):
+    """Get the exit status for a bottle state, as for genie -r."""
+    return {'running': 0, 'stopped': 1, 'starting': 2, 'stopping': 3, 'degraded': 4}.get(state, 5)
+
+
+def print_status(status):
+    """Print the status for people to read."""
+    def show(value):
+        if value is None:
+            return '-'
+        if isinstance(value, bool):
+            return 'yes' if value else 'no'
+        if isinstance(value, list):
+            return ', '.join(value) if value else 'none'
+        return str(value)
+
+    for name, value in status.items():
+        if name in ('uptime', 'boot_duration') and value is not None:
+            value = f"{value:.3f}s"
+
+        if name == 'cgroup' and value is not None:
+            _print_cgroup(value, show)
+            continue
+
+        print(f"{name.replace('_', ' ')}: {show(value)}")
+
+
+# Internal functions
+def _print_cgroup(usage, show):
+    """Print the bottle cgroup's resource usage against its limits."""
+    def seconds(value):
+        return None if value is None else f"{value:.3f}s"
+
+    print(f"cgroup: {usage['path']}")
+    print(f"  cpu: {show(seconds(usage['cpu_usage_seconds']))} used, "
+          f"{show(seconds(usage['cpu_throttled_seconds']))} throttled "
+          f"(cpu.max {show(usage['cpu.max'])}, cpu.weight {show(usage['cpu.weight'])})")
+    print(f"  memory: {show(usage['memory_current'])} bytes "
+          f"(memory.high {show(usage['memory.high'])}, memory.max {show(usage['memory.max'])})")
+    print(f"  pids: {show(usage['pids_current'])} (pids.max {show(usage['pids.max'])})")
+    print(f"  io: io.weight {show(usage['io.weight'])}")
+
+
+def _uptime(sdp):
+    """Get how long the specified process has been running, in seconds, or None if it cannot be found."""
+    start_time = bottle.get_start_time(sdp)
+
+    if start_time is None:
+        return None
+
+    with open('/proc/uptime', 'r') as uptimefile:
+        uptime = float(uptimefile.read().split()[0])
+
+    return round(uptime - start_time / os.sysconf('SC_CLK_TCK'), 3)
@@ -0,0 +1,61 @@
+# System calls module
+#
+# Thin wrappers over the libc functions for the few system calls genie makes
+# which Python does not provide, so that it need not fork mount, umount or
+# hostname for them. Each raises OSError on failure, as the os module does.
+
+import ctypes
+import os
+
+# Global variables
+
+# Mount flags.
+MS_BIND = 0x1000
+
+_libc = None
+
+
+# functions
+def mount(source, target, fstype=None, flags=0, data=None):
+    """Mount source on target, with the specified filesystem type, flags, and data."""
+    _check(_get_libc().mount(_encode(source), _encode(target), _encode(fstype),
+                             ctypes.c_ulong(flags), _encode(data)))
+
+
+def umount(target, flags=0):
+    """Unmount the filesystem mounted on target."""
+    _check(_get_libc().umount2(_encode(target), flags))
+
+
+def sethostname(name):
+    """Set the hostname."""
+    encoded = os.fsencode(name)
+    _check(_get_libc().sethostname(encoded, ctypes.c_size_t(len(encoded))))
+
+
+def setns(fd, nstype=0):
+    """Reassociate this thread with the namespace(s) referred to by fd."""
+    _check(_get_libc().setns(fd, nstype))
+
+
+# Internal functions
+def _get_libc():
+    """Get the C library, loading it on first use."""
+    global _libc
+
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+
+    return _libc
+
+
+def _encode(value):
+    """Encode a string argument for libc, passing None through as NULL."""
+    return None if value is None else os.fsencode(value)
+
+
+def _check(result):
+    """Raise OSError from errno if a libc call failed."""
+    if result != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
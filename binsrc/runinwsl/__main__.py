@@ -1,7 +1,6 @@
 #! /usr/bin/env python3
 
 import os
-import subprocess
 import sys
 
 def print_usage():
@@ -23,9 +22,10 @@ def entrypoint():
     # Change to correct working directory
     os.chdir (ewd)
 
+    # Replace ourselves with the command, so that its exit status and any
+    # terminating signal reach our caller directly.
     try:
-        sp = subprocess.run (cmd)
-        exit (sp.returncode)
+        os.execvp (cmd[0], cmd)
     except Exception as e:
       print (f"runinwsl: error running command '{cmd}': {e.strerror}")
       exit (127)
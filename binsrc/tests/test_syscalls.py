@@ -0,0 +1,136 @@
+# Tests for the system calls module, and its use by the host, binfmts and
+# apparmor modules, with the C library replaced by a fake; run from binsrc
+# with:
+#
+#   python3 -m unittest discover -s tests
+
+import ctypes
+import errno
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'genie'))
+
+import apparmor  # noqa: E402
+import binfmts  # noqa: E402
+import host  # noqa: E402
+import syscalls  # noqa: E402
+
+
+class FakeLibc:
+    """A stand-in for the C library, recording calls and failing with errno if asked to."""
+
+    def __init__(self, errno=0):
+        self.errno = errno
+        self.calls = []
+
+    def _result(self, name, *args):
+        self.calls.append((name,) + args)
+        return -1 if self.errno else 0
+
+    def mount(self, source, target, fstype, flags, data):
+        return self._result('mount', source, target, fstype, flags.value, data)
+
+    def umount2(self, target, flags):
+        return self._result('umount2', target, flags)
+
+    def sethostname(self, name, length):
+        return self._result('sethostname', name, length.value)
+
+
+class SyscallsTestCase(unittest.TestCase):
+    """Base for tests with a fake C library."""
+
+    def use_libc(self, libc):
+        patches = [mock.patch.object(syscalls, '_get_libc', return_value=libc),
+                   mock.patch.object(ctypes, 'get_errno', return_value=libc.errno)]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        return libc
+
+
+class TestWrappers(SyscallsTestCase):
+    """The wrappers pass their arguments on, and turn errno into OSError."""
+
+    def test_mount(self):
+        libc = self.use_libc(FakeLibc())
+        syscalls.mount('binfmt_misc', '/proc/sys/fs/binfmt_misc', 'binfmt_misc')
+        self.assertEqual(libc.calls, [('mount', b'binfmt_misc', b'/proc/sys/fs/binfmt_misc', b'binfmt_misc', 0, None)])
+
+    def test_bind_mount(self):
+        libc = self.use_libc(FakeLibc())
+        syscalls.mount('/run/genie.hostname', '/etc/hostname', flags=syscalls.MS_BIND)
+        self.assertEqual(libc.calls, [('mount', b'/run/genie.hostname', b'/etc/hostname', None, syscalls.MS_BIND, None)])
+
+    def test_mount_failure(self):
+        self.use_libc(FakeLibc(errno.EPERM))
+        with self.assertRaises(OSError) as cm:
+            syscalls.mount('securityfs', '/sys/kernel/security', 'securityfs')
+        self.assertEqual(cm.exception.errno, errno.EPERM)
+
+    def test_umount(self):
+        libc = self.use_libc(FakeLibc())
+        syscalls.umount('/etc/hostname')
+        self.assertEqual(libc.calls, [('umount2', b'/etc/hostname', 0)])
+
+    def test_umount_failure(self):
+        self.use_libc(FakeLibc(errno.EINVAL))
+        with self.assertRaises(OSError) as cm:
+            syscalls.umount('/etc/hostname')
+        self.assertEqual(cm.exception.errno, errno.EINVAL)
+
+    def test_sethostname(self):
+        libc = self.use_libc(FakeLibc())
+        syscalls.sethostname('simbottle')
+        self.assertEqual(libc.calls, [('sethostname', b'simbottle', 9)])
+
+    def test_sethostname_failure(self):
+        self.use_libc(FakeLibc(errno.EPERM))
+        with self.assertRaises(OSError) as cm:
+            syscalls.sethostname('simbottle')
+        self.assertEqual(cm.exception.errno, errno.EPERM)
+        self.assertEqual(cm.exception.strerror, os.strerror(errno.EPERM))
+
+
+class TestCallers(SyscallsTestCase):
+    """Failures are reported with the messages genie gave when it ran mount and friends."""
+
+    def run_quietly(self, function, *args):
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            result = function(*args)
+        return result, stdout.getvalue()
+
+    def test_binfmts_umount_failure(self):
+        self.use_libc(FakeLibc(errno.EINVAL))
+        with mock.patch('os.path.exists', return_value=True):
+            _, printed = self.run_quietly(binfmts.umount, False)
+        self.assertEqual(printed, "genie: failed to unmount binfmt_misc filesystem; attempting to continue\n")
+
+    def test_binfmts_mount_failure(self):
+        self.use_libc(FakeLibc(errno.EPERM))
+        with mock.patch('os.path.exists', return_value=False):
+            _, printed = self.run_quietly(binfmts.mount, False)
+        self.assertEqual(printed, "genie: failed to remount binfmt_misc filesystem; attempting to continue\n")
+
+    def test_apparmor_mount_failure(self):
+        self.use_libc(FakeLibc(errno.EPERM))
+        with mock.patch('os.path.exists', return_value=False):
+            result, printed = self.run_quietly(apparmor.configure, False)
+        self.assertIsNone(result)
+        self.assertEqual(printed, "genie: failed to mount AppArmor filesystem; attempting to continue without AppArmor\n")
+
+    def test_host_restore_umount_failure(self):
+        libc = self.use_libc(FakeLibc(errno.EINVAL))
+        _, printed = self.run_quietly(host.restore, False)
+        self.assertEqual(printed, "genie: failed to unmount hostname file; attempting to continue\n")
+        self.assertEqual(libc.calls, [('umount2', b'/etc/hostname', 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+#
+# Check that a command run through the broker follows its client.
+#
+# Runs genie -c sleep (and genie -d -c sleep) through the broker of a simulated
+# bottle (see simbottle), then interrupts the client, and then, in a second
+# run, kills it outright. The command is not in the client's process group, so
+# it gets the interrupt only if the broker forwards it, and ends with its
+# client only if the broker notices that the client has gone away; either way,
+# it must not be left running, e.g.:
+#
+#   python3 tools/broker-signals.py out/genie
+#
+# Needs no privileges, and no WSL.
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import simbottle
+
+# How long the command sleeps for; long enough that it ending at all shows it was signalled.
+command_seconds = 37
+
+# Ways of ending the client, and the exit status the client should report (None if it cannot).
+endings = [
+    ('interrupt', signal.SIGINT, 128 + signal.SIGINT),
+    ('kill', signal.SIGKILL, None),
+]
+
+
+def parse_command_line():
+    """Create the command-line option parser and parse arguments."""
+    parser = argparse.ArgumentParser(
+        description="Check that commands run through the broker of a simulated bottle follow their client's signals.")
+
+    parser.add_argument('--timeout', type=float, default=10,
+                        help="seconds to wait for the command to start, and to end")
+    parser.add_argument('genie', nargs='?', default='genie',
+                        help="genie zipapp or source directory to check")
+
+    return parser.parse_args()
+
+
+def commands():
+    """List the pids of running instances of the command."""
+    wanted = ['sleep', str(command_seconds)]
+    pids = []
+
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as cmdfile:
+                cmdline = cmdfile.read().split(b'\0')[:-1]
+        except OSError:
+            continue
+
+        if [os.fsdecode(arg) for arg in cmdline] == wanted:
+            pids.append(int(pid))
+
+    return pids
+
+
+def wait_for(predicate, timeout):
+    """Wait for predicate to become true; returns whether it did."""
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        simbottle.reap()
+
+        if predicate():
+            return True
+
+        time.sleep(0.05)
+
+    return predicate()
+
+
+def check(args, signum, expected, timeout):
+    """Run genie args through the broker, end the client with signum, and list any problems."""
+    client = subprocess.Popen(simbottle.genie_command(args + ['-c', 'sleep', str(command_seconds)]),
+                              stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        if not wait_for(lambda: commands(), timeout):
+            return ["command never started"]
+
+        client.send_signal(signum)
+
+        problems = []
+
+        try:
+            status = client.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return ["client did not exit"]
+
+        if expected is not None and status != expected:
+            problems.append(f"client exited {status}, not {expected}")
+
+        if not wait_for(lambda: not commands(), timeout):
+            problems.append("command left running")
+
+        return problems
+    finally:
+        if client.poll() is None:
+            client.kill()
+            client.wait()
+
+        for pid in commands():
+            os.kill(pid, signal.SIGKILL)
+
+
+def entrypoint():
+    """Entrypoint."""
+    arguments = parse_command_line()
+
+    simbottle.enter()
+    simbottle.setup(arguments.genie, settings={'broker': 'true'})
+
+    genie = simbottle.genie_command([])
+    subprocess.run(genie + ['-i'], stdout=subprocess.DEVNULL, check=True)
+
+    failed = False
+
+    try:
+        if not os.path.exists('/run/genie.broker'):
+            sys.exit("broker-signals: the broker did not start")
+
+        for args in [[], ['-d']]:
+            for name, signum, expected in endings:
+                problems = check(args, signum, expected, arguments.timeout)
+
+                verdict = 'FAIL: ' + '; '.join(problems) if problems else 'ok'
+                print(f"{'genie ' + ' '.join(args + ['-c']):12} {name:10} {verdict}")
+
+                failed = failed or bool(problems)
+    finally:
+        subprocess.run(genie + ['-u'], stdout=subprocess.DEVNULL)
+        simbottle.wait_for_shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+entrypoint()
@@ -0,0 +1,263 @@
+#! /usr/bin/env python3
+#
+# Stress genie's cold start with many concurrent clients.
+#
+# Starts N genie -c clients at the same instant against a stopped simulated
+# bottle (see simbottle), as a CI job launching many commands at once would,
+# and reports per round: time to the first command completing, the latency
+# distribution, how many times systemd was started (more than once is a
+# duplicate init), how many clients failed and why, and which of genie's
+# runtime files are left behind once every client has exited (e.g. a stale
+# /run/genie.init.lock). The bottle is shut down between rounds, e.g.:
+#
+#   python3 tools/coldstart-stress.py -j 50 --boot-delay 2 out/genie
+#
+# Needs no privileges, and no WSL.
+
+import argparse
+import collections
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import simbottle
+
+# Runtime files which may legitimately exist while the bottle is up.
+running_files = {'genie.bottle', 'genie.env', 'genie.facts', 'genie.hostname', 'genie.metrics', 'genie.path',
+                 'genie.spans', 'genie.spans.1', 'genie.systemd.pid', 'genie.broker', 'genie.notify'}
+
+# Runtime files which may legitimately exist after the bottle is shut down.
+stopped_files = {'genie.env', 'genie.facts', 'genie.metrics', 'genie.path', 'genie.spans', 'genie.spans.1'}
+
+
+def parse_command_line():
+    """Create the command-line option parser and parse arguments."""
+    parser = argparse.ArgumentParser(
+        description="Stress genie's cold start with many concurrent clients against a simulated bottle.")
+
+    parser.add_argument('-j', '--clients', type=int, default=32,
+                        help="number of concurrent clients per round")
+    parser.add_argument('-n', '--rounds', type=int, default=5,
+                        help="number of cold-start rounds")
+    parser.add_argument('--boot-delay', type=float, default=1.0,
+                        help="seconds the simulated systemd takes to boot")
+    parser.add_argument('--shutdown-delay', type=float, default=0.0,
+                        help="seconds the simulated systemd takes to power off")
+    parser.add_argument('-d', '--direct', action='store_true',
+                        help="run the clients' commands with genie -d")
+    parser.add_argument('--timeout', type=int, default=120,
+                        help="seconds to wait for all clients in a round")
+    parser.add_argument('-s', '--setting', action='append', default=[], metavar='KEY=VALUE',
+                        help="genie.ini setting for the run (may be repeated)")
+    parser.add_argument('genie', nargs='?', default='genie',
+                        help="genie zipapp or source directory to stress")
+
+    return parser.parse_args()
+
+
+def launch(commandline, count):
+    """Fork count clients, held until all exist, then release them at once; returns {pid: output file} and the release time."""
+    go_r, go_w = os.pipe()
+    clients = {}
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    for _ in range(count):
+        output = tempfile.TemporaryFile()
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                os.close(go_w)
+                devnull = os.open(os.devnull, os.O_RDONLY)
+                os.dup2(devnull, 0)
+                os.dup2(output.fileno(), 1)
+                os.dup2(output.fileno(), 2)
+
+                # Wait for the starting gun (our end of the pipe closing).
+                os.read(go_r, 1)
+                os.execv(commandline[0], commandline)
+            finally:
+                os._exit(127)
+
+        clients[pid] = output
+
+    os.close(go_r)
+    start = time.monotonic()
+    os.close(go_w)
+
+    return clients, start
+
+
+def collect(clients, start, timeout):
+    """Wait for the clients to exit; returns {pid: (exit status, latency in seconds)}."""
+    results = {}
+
+    def alarm_handler(signum, frame):
+        raise TimeoutError()
+
+    previous_handler = set_alarm(alarm_handler, timeout)
+
+    try:
+        while len(results) < len(clients):
+            pid, wstatus = os.waitpid(-1, 0)
+
+            # Orphans of daemonize are reparented to us, too.
+            if pid not in clients:
+                continue
+
+            if os.WIFSIGNALED(wstatus):
+                status = 128 + os.WTERMSIG(wstatus)
+            else:
+                status = os.WEXITSTATUS(wstatus)
+
+            results[pid] = (status, time.monotonic() - start)
+    except TimeoutError:
+        for pid in clients:
+            if pid not in results:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+                os.waitpid(pid, 0)
+                results[pid] = (None, None)
+    finally:
+        set_alarm(previous_handler, 0)
+
+    return results
+
+
+def set_alarm(handler, timeout):
+    """Install handler for SIGALRM, and set the alarm (or clear it, if timeout is 0); returns the previous handler."""
+    previous_handler = signal.signal(signal.SIGALRM, handler)
+    signal.alarm(timeout)
+
+    return previous_handler
+
+
+def failure_reason(output):
+    """Get the last line a failed client printed, as a summary of why it failed."""
+    output.seek(0)
+    lines = [line.strip() for line in output.read().decode(errors='replace').splitlines() if line.strip()]
+
+    return lines[-1] if lines else '(no output)'
+
+
+def run_round(commandline, clients_count, timeout):
+    """Run one cold-start round; returns a dict of measurements."""
+    inits_before = simbottle.init_count()
+
+    clients, start = launch(commandline, clients_count)
+    results = collect(clients, start, timeout)
+
+    simbottle.reap()
+
+    latencies = sorted(latency for status, latency in results.values() if status == 0)
+    reasons = collections.Counter()
+
+    for pid, (status, _) in results.items():
+        if status is None:
+            reasons['(timed out)'] += 1
+        elif status != 0:
+            reasons[failure_reason(clients[pid])] += 1
+
+        clients[pid].close()
+
+    measurements = {
+        'inits': simbottle.init_count() - inits_before,
+        'succeeded': len(latencies),
+        'latencies': latencies,
+        'failures': reasons,
+        'leftovers': [f for f in simbottle.leftovers() if f not in running_files],
+    }
+
+    # Shut the bottle down for the next round, and see what that leaves behind.
+    status = subprocess.run(simbottle.genie_command(['-u']), stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+    if not simbottle.wait_for_shutdown():
+        sys.exit("coldstart-stress: simulated systemd did not exit after genie -u")
+
+    measurements['shutdown'] = status
+    measurements['stopped_leftovers'] = [f for f in simbottle.leftovers() if f not in stopped_files]
+
+    return measurements
+
+
+def percentile(ordered, fraction):
+    """Get the specified percentile of an ordered list."""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(number, clients_count, m):
+    """Print the measurements for one round; returns True if the round showed problems."""
+    lat = m['latencies']
+
+    if lat:
+        timing = (f"first {lat[0] * 1000:7.0f} ms  p50 {statistics.median(lat) * 1000:7.0f} ms  "
+                  f"p95 {percentile(lat, 0.95) * 1000:7.0f} ms  p99 {percentile(lat, 0.99) * 1000:7.0f} ms  "
+                  f"max {lat[-1] * 1000:7.0f} ms")
+    else:
+        timing = "no client succeeded"
+
+    print(f"round {number}: {m['succeeded']}/{clients_count} ok, systemd started {m['inits']}x; {timing}")
+
+    for reason, count in m['failures'].most_common():
+        print(f"    {count:4} failed: {reason}")
+
+    if m['leftovers']:
+        print(f"    left behind with bottle running: {', '.join(m['leftovers'])}")
+
+    if m['shutdown'] != 0:
+        print(f"    genie -u failed, exit code = {m['shutdown']}")
+
+    if m['stopped_leftovers']:
+        print(f"    left behind after shutdown: {', '.join(m['stopped_leftovers'])}")
+
+    return (m['succeeded'] != clients_count or m['inits'] != 1 or bool(m['leftovers'])
+            or m['shutdown'] != 0 or bool(m['stopped_leftovers']))
+
+
+def entrypoint():
+    """Entrypoint."""
+    arguments = parse_command_line()
+
+    if not os.path.exists(arguments.genie):
+        sys.exit(f"coldstart-stress: {arguments.genie} not found")
+
+    simbottle.enter()
+
+    settings = dict(s.split('=', 1) for s in arguments.setting)
+
+    simbottle.setup(arguments.genie, boot_delay=arguments.boot_delay,
+                    shutdown_delay=arguments.shutdown_delay, settings=settings)
+
+    commandline = simbottle.genie_command((['-d'] if arguments.direct else []) + ['-c', 'true'])
+
+    all_latencies = []
+    problems = 0
+
+    for number in range(1, arguments.rounds + 1):
+        m = run_round(commandline, arguments.clients, arguments.timeout)
+        all_latencies.extend(m['latencies'])
+
+        if report(number, arguments.clients, m):
+            problems += 1
+
+    all_latencies.sort()
+
+    if all_latencies:
+        print(f"overall: p50 {statistics.median(all_latencies) * 1000:.0f} ms  "
+              f"p99 {percentile(all_latencies, 0.99) * 1000:.0f} ms  max {all_latencies[-1] * 1000:.0f} ms; "
+              f"{problems}/{arguments.rounds} rounds with problems")
+
+    sys.exit(1 if problems else 0)
+
+
+entrypoint()
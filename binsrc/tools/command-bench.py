@@ -0,0 +1,226 @@
+#! /usr/bin/env python3
+#
+# Benchmark the cost of genie's commands against a simulated bottle.
+#
+# Runs the real genie (zipapp or source directory) inside a sandbox built from
+# unprivileged user namespaces (see simbottle), through a full cycle of
+# commands from a stopped bottle to a running one and back, and reports for
+# each command its wall time, the number of tasks (processes and threads) it
+# created, and its peak RSS. Results can be saved as a baseline, and later
+# runs compared against it, e.g.:
+#
+#   python3 tools/command-bench.py --save-baseline out/bench-baseline.json out/genie
+#   python3 tools/command-bench.py --baseline out/bench-baseline.json out/genie
+#
+# Needs no privileges, and no WSL.
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import simbottle
+
+# The cycle of commands run in each iteration: (name, arguments, expected exit status).
+cycle = [
+    ('-r (stopped)', ['-r'], 1),
+    ('-b (no bottle)', ['-b'], 2),
+    ('-i', ['-i'], 0),
+    ('-b', ['-b'], 1),
+    ('-r', ['-r'], 0),
+    ('-c true', ['-c', 'true'], 0),
+    ('-d -c true', ['-d', '-c', 'true'], 0),
+    ('-u', ['-u'], 0),
+]
+
+# Default regression thresholds.
+wall_tolerance = 25
+rss_tolerance = 10
+
+
+def parse_command_line():
+    """Create the command-line option parser and parse arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark genie's commands against a simulated bottle.")
+
+    parser.add_argument('-n', '--iterations', type=int, default=10,
+                        help="number of times to run the cycle of commands")
+    parser.add_argument('--boot-delay', type=float, default=0.0,
+                        help="seconds the simulated systemd takes to boot")
+    parser.add_argument('--shutdown-delay', type=float, default=0.0,
+                        help="seconds the simulated systemd takes to power off")
+    parser.add_argument('--no-bus', action='store_true',
+                        help="do not simulate systemd's private bus socket")
+    parser.add_argument('-s', '--setting', action='append', default=[], metavar='KEY=VALUE',
+                        help="genie.ini setting for the run (may be repeated)")
+    parser.add_argument('--baseline', metavar='FILE',
+                        help="compare results with the baseline in FILE")
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help="save results as the baseline in FILE")
+    parser.add_argument('--wall-tolerance', type=float, default=wall_tolerance, metavar='PERCENT',
+                        help="allowed increase in median wall time over the baseline")
+    parser.add_argument('--rss-tolerance', type=float, default=rss_tolerance, metavar='PERCENT',
+                        help="allowed increase in peak RSS over the baseline")
+    parser.add_argument('genie', nargs='?', default='genie',
+                        help="genie zipapp or source directory to benchmark")
+
+    return parser.parse_args()
+
+
+def measure(args, timeout=60):
+    """Run genie with args; returns its exit status, wall time (ms), tasks created and peak RSS (KiB), and its output."""
+    output = tempfile.TemporaryFile()
+
+    def alarm_handler(signum, frame):
+        raise TimeoutError()
+
+    before = simbottle.last_pid()
+    start = time.monotonic()
+
+    proc = subprocess.Popen(simbottle.genie_command(args), stdin=subprocess.DEVNULL,
+                            stdout=output, stderr=subprocess.STDOUT)
+
+    signal.signal(signal.SIGALRM, alarm_handler)
+    signal.alarm(timeout)
+
+    try:
+        _, wstatus, usage = os.wait4(proc.pid, 0)
+    except TimeoutError:
+        proc.kill()
+        _, wstatus, usage = os.wait4(proc.pid, 0)
+    finally:
+        signal.alarm(0)
+
+    elapsed = (time.monotonic() - start) * 1000
+    tasks = simbottle.last_pid() - before
+
+    if os.WIFSIGNALED(wstatus):
+        status = 128 + os.WTERMSIG(wstatus)
+    else:
+        status = os.WEXITSTATUS(wstatus)
+
+    # Daemonized processes which have exited are reparented to us; clear them away.
+    simbottle.reap()
+
+    output.seek(0)
+    text = output.read().decode(errors='replace')
+    output.close()
+
+    return status, elapsed, tasks, usage.ru_maxrss, text
+
+
+def run_cycles(iterations):
+    """Run the cycle of commands; returns {name: [(wall, tasks, rss), ...]}."""
+    results = {name: [] for name, _, _ in cycle}
+
+    # One untimed cycle, to warm caches and probe host facts.
+    for i in range(iterations + 1):
+        for name, args, expected in cycle:
+            status, elapsed, tasks, rss, text = measure(args)
+
+            if status != expected:
+                sys.stderr.write(text)
+                sys.exit(f"command-bench: genie {' '.join(args)} exited with {status}, expected {expected}")
+
+            if i > 0:
+                results[name].append((elapsed, tasks, rss))
+
+        if not simbottle.wait_for_shutdown():
+            sys.exit("command-bench: simulated systemd did not exit after genie -u")
+
+    return results
+
+
+def summarize(results):
+    """Summarize the results per command: median wall time, median tasks and maximum peak RSS."""
+    summary = {}
+
+    for name, samples in results.items():
+        walls = sorted(s[0] for s in samples)
+        summary[name] = {
+            'wall_ms': round(statistics.median(walls), 2),
+            'wall_p95_ms': round(walls[min(len(walls) - 1, int(len(walls) * 0.95))], 2),
+            'tasks': statistics.median_low(s[1] for s in samples),
+            'rss_kib': max(s[2] for s in samples),
+        }
+
+    return summary
+
+
+def compare(summary, baseline, wall_limit, rss_limit):
+    """Print the summary, compared with the baseline (if any); returns True if there are regressions."""
+    regressed = False
+
+    print(f"{'command':20} {'median':>10} {'p95':>10} {'tasks':>6} {'peak RSS':>10}")
+
+    for name, _, _ in cycle:
+        now = summary[name]
+        line = (f"{'genie ' + name:20} {now['wall_ms']:7.1f} ms {now['wall_p95_ms']:7.1f} ms "
+                f"{now['tasks']:6} {now['rss_kib']:6} KiB")
+
+        was = (baseline or {}).get(name)
+
+        if was is not None:
+            problems = []
+
+            wall_change = (now['wall_ms'] - was['wall_ms']) * 100 / was['wall_ms']
+            rss_change = (now['rss_kib'] - was['rss_kib']) * 100 / was['rss_kib']
+
+            if wall_change > wall_limit:
+                problems.append(f"wall time +{wall_change:.0f}%")
+            if now['tasks'] > was['tasks']:
+                problems.append(f"tasks {was['tasks']} -> {now['tasks']}")
+            if rss_change > rss_limit:
+                problems.append(f"peak RSS +{rss_change:.0f}%")
+
+            line += f"   ({wall_change:+.0f}% wall)   " + ('REGRESSED: ' + ', '.join(problems) if problems else 'ok')
+            regressed = regressed or bool(problems)
+
+        print(line)
+
+    return regressed
+
+
+def entrypoint():
+    """Entrypoint."""
+    arguments = parse_command_line()
+
+    if not os.path.exists(arguments.genie):
+        sys.exit(f"command-bench: {arguments.genie} not found")
+
+    simbottle.enter()
+
+    settings = dict(s.split('=', 1) for s in arguments.setting)
+
+    simbottle.setup(arguments.genie, boot_delay=arguments.boot_delay,
+                    shutdown_delay=arguments.shutdown_delay, bus=not arguments.no_bus,
+                    settings=settings)
+
+    summary = summarize(run_cycles(arguments.iterations))
+
+    baseline = None
+    if arguments.baseline is not None:
+        with open(arguments.baseline, 'r') as basefile:
+            baseline = json.load(basefile)['commands']
+
+    regressed = compare(summary, baseline, arguments.wall_tolerance, arguments.rss_tolerance)
+
+    if arguments.save_baseline is not None:
+        with open(arguments.save_baseline, 'w') as basefile:
+            json.dump({'genie': arguments.genie, 'iterations': arguments.iterations,
+                       'settings': settings, 'kernel': os.uname().release,
+                       'python': sys.version.split()[0], 'commands': summary},
+                      basefile, indent=2)
+            print("", file=basefile)
+
+        print(f"baseline saved to {arguments.save_baseline}")
+
+    sys.exit(1 if regressed else 0)
+
+
+entrypoint()
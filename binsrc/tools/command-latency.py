@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+#
+# Compare the latency of genie -c via a machinectl session with that of
+# genie -d -c (direct entry into the bottle's namespaces).
+#
+# Run on a WSL host with the bottle already running, e.g.:
+#
+#   python3 tools/command-latency.py -n 50 -- true
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def parse_command_line():
+    """Create the command-line option parser and parse arguments."""
+    parser = argparse.ArgumentParser(
+        description="Compare genie -c latency via machinectl and via direct namespace entry.")
+
+    parser.add_argument('-n', '--iterations', type=int, default=20,
+                        help="number of times to run the command in each mode")
+    parser.add_argument('-g', '--genie', default='genie',
+                        help="genie executable to use")
+    parser.add_argument('command', nargs=argparse.REMAINDER,
+                        help="command to run (default: true)")
+
+    return parser.parse_args()
+
+
+def measure(commandline, iterations):
+    """Run commandline repeatedly; returns the list of wall times, in milliseconds."""
+    times = []
+
+    for _ in range(iterations):
+        start = time.monotonic()
+        sp = subprocess.run(commandline, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        times.append((time.monotonic() - start) * 1000)
+
+        if sp.returncode != 0:
+            sys.exit(f"command-latency: '{' '.join(commandline)}' failed, exit code = {sp.returncode}")
+
+    return times
+
+
+def report(name, times):
+    """Print a summary of the wall times for one mode."""
+    ordered = sorted(times)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    print(f"{name:12} min {ordered[0]:8.1f} ms   median {statistics.median(ordered):8.1f} ms   p95 {p95:8.1f} ms")
+
+
+def entrypoint():
+    """Entrypoint."""
+    arguments = parse_command_line()
+
+    command = arguments.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        command = ['true']
+
+    modes = [('machinectl', [arguments.genie, '-c'] + command),
+             ('direct', [arguments.genie, '-d', '-c'] + command)]
+
+    results = {}
+
+    for name, commandline in modes:
+        # One untimed run each, to warm caches.
+        measure(commandline, 1)
+        results[name] = measure(commandline, arguments.iterations)
+
+    for name, _ in modes:
+        report(name, results[name])
+
+    speedup = statistics.median(results['machinectl']) / statistics.median(results['direct'])
+    print(f"direct mode is {speedup:.1f}x faster (median)")
+
+
+entrypoint()
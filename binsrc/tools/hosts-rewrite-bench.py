@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+#
+# Benchmark genie's rewriting of the hosts file on hostname changes.
+#
+# Generates hosts files of various sizes, in the style of an ad-blocking hosts
+# file with the machine's own entries at the top, and times renaming the
+# hostname in them (as genie -i and genie -u do), with the peak memory
+# allocated while doing so, when the hostname is near the top, at the very end,
+# and not present at all (which should not write the file). With --compare,
+# also runs the previous python_hosts-based rewriter, if python_hosts is
+# installed, e.g.:
+#
+#   python3 tools/hosts-rewrite-bench.py --compare -l 10000 -l 100000 -l 500000
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'genie'))
+
+import host  # noqa: E402
+
+hostname = 'benchhost'
+
+
+def parse_command_line():
+    """Create the command-line option parser and parse arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark genie's hosts file rewriting on large hosts files.")
+
+    parser.add_argument('-l', '--lines', type=int, action='append',
+                        help="hosts file size, in lines (may be repeated; default 10000, 100000 and 500000)")
+    parser.add_argument('-n', '--iterations', type=int, default=5,
+                        help="number of runs per case; the median is reported")
+    parser.add_argument('--compare', action='store_true',
+                        help="also run the previous, python_hosts-based, rewriter")
+
+    return parser.parse_args()
+
+
+def generate(path, lines, position):
+    """Write a hosts file of the given size, with our hostname at 'top', 'end', or 'none'."""
+    with open(path, 'w') as hosts:
+        print("# This file was generated for benchmarking genie's hosts file rewriting.", file=hosts)
+        print("127.0.0.1\tlocalhost", file=hosts)
+
+        if position == 'top':
+            print(f"127.0.1.1\t{hostname}.localdomain\t{hostname}", file=hosts)
+
+        print("::1\tip6-localhost ip6-loopback", file=hosts)
+        print("", file=hosts)
+        print("# Blocked hosts", file=hosts)
+
+        for i in range(lines - (8 if position != 'none' else 7)):
+            print(f"0.0.0.0 ads{i}.tracker{i % 97}.example.com", file=hosts)
+
+        if position == 'end':
+            print(f"127.0.1.1\t{hostname}.localdomain\t{hostname}", file=hosts)
+
+        print("# End of blocked hosts", file=hosts)
+
+
+def legacy_rename(old_name, new_name, path):
+    """The previous rewriter, using python_hosts."""
+    from python_hosts import Hosts, HostsEntry
+
+    hosts = Hosts(path=path)
+
+    for e in hosts.find_all_matching(name=old_name):
+        new_names = []
+        for n in e.names:
+            new_names.append(n.replace(old_name, new_name))
+            new_entry = HostsEntry(
+                entry_type=e.entry_type, address=e.address, names=new_names, comment=e.comment)
+            hosts.add([new_entry], force=True)
+
+    hosts.write()
+
+
+def streaming_rename(old_name, new_name, path):
+    """The streaming rewriter."""
+    host.rename_in_hosts_file(old_name, new_name, path)
+
+
+def measure(rename, template, work, iterations):
+    """Time rename on fresh copies of template; returns median seconds, peak allocated KiB, and whether the file was written."""
+    times = []
+    written = False
+
+    for _ in range(iterations):
+        shutil.copyfile(template, work)
+        os.utime(work, ns=(0, 0))
+
+        start = time.perf_counter()
+        rename(hostname, hostname + '-wsl', work)
+        times.append(time.perf_counter() - start)
+
+        written = os.stat(work).st_mtime_ns != 0
+
+    # Measure memory separately, since tracing allocations slows them down.
+    shutil.copyfile(template, work)
+
+    tracemalloc.start()
+    rename(hostname, hostname + '-wsl', work)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return statistics.median(times), peak // 1024, written
+
+
+def entrypoint():
+    """Entrypoint."""
+    arguments = parse_command_line()
+
+    implementations = [('streaming', streaming_rename)]
+
+    if arguments.compare:
+        try:
+            import python_hosts  # noqa: F401
+            implementations.append(('python_hosts', legacy_rename))
+        except ImportError:
+            print("hosts-rewrite-bench: python_hosts is not installed; not comparing", file=sys.stderr)
+
+    directory = tempfile.mkdtemp(prefix='hosts-bench.')
+
+    try:
+        print(f"{'lines':>8} {'hostname':8} {'rewriter':12} {'median':>10} {'peak alloc':>12}  written")
+
+        for lines in arguments.lines or [10000, 100000, 500000]:
+            for position in ['top', 'end', 'none']:
+                template = os.path.join(directory, 'template')
+                generate(template, lines, position)
+
+                for name, rename in implementations:
+                    elapsed, peak, written = measure(rename, template, os.path.join(directory, 'hosts'),
+                                                     arguments.iterations)
+
+                    print(f"{lines:8} {position:8} {name:12} {elapsed * 1000:7.1f} ms {peak:8} KiB  "
+                          f"{'yes' if written else 'no'}")
+    finally:
+        shutil.rmtree(directory)
+
+
+entrypoint()
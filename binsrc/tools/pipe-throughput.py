@@ -0,0 +1,159 @@
+#! /usr/bin/env python3
+#
+# Compare the throughput of streams through genie -c via a machinectl session
+# (on a pseudo-terminal), genie -p -c (pipe mode) and genie -d -c (direct).
+#
+# For each mode, streams SIZE MiB of binary data through 'cat' in the bottle
+# and back, and reports the throughput, whether the data came back intact
+# (a pseudo-terminal's line discipline may mangle or swallow it), and whether
+# standard output and standard error were kept apart. Run on a WSL host with
+# the bottle already running, e.g.:
+#
+#   python3 tools/pipe-throughput.py -s 4096
+#
+# With --simulate, runs against a simulated bottle (see simbottle) instead,
+# which needs no privileges and no WSL; the simulated machinectl has no
+# pseudo-terminal, so this only checks the plumbing.
+
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Size of the pseudo-random block which the stream repeats.
+_block_size = 1024 * 1024
+
+modes = {
+    'machinectl': [],
+    'pipe': ['-p'],
+    'direct': ['-d'],
+}
+
+
+def parse_command_line():
+    """Create the command-line option parser and parse arguments."""
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput of streams through genie -c in each of its modes.")
+
+    parser.add_argument('-s', '--size', type=int, default=1024, metavar='MIB',
+                        help="amount of data to stream through each mode, in MiB")
+    parser.add_argument('-m', '--mode', action='append', choices=list(modes),
+                        help="mode to measure (may be repeated; default all)")
+    parser.add_argument('-t', '--timeout', type=float, default=600, metavar='SECONDS',
+                        help="give up on a mode after this long")
+    parser.add_argument('--simulate', action='store_true',
+                        help="run against a simulated bottle, rather than the real one")
+    parser.add_argument('genie', nargs='?', default='genie',
+                        help="genie executable (or, with --simulate, zipapp or source directory) to use")
+
+    return parser.parse_args()
+
+
+def stream(commandline, size, timeout):
+    """Stream size MiB through commandline; returns the seconds taken and whether the data came back intact, or None on timeout."""
+    block = os.urandom(_block_size)
+    expected = hashlib.sha256()
+
+    for _ in range(size):
+        expected.update(block)
+
+    proc = subprocess.Popen(commandline, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, bufsize=0)
+
+    def feed():
+        try:
+            for _ in range(size):
+                proc.stdin.write(block)
+            proc.stdin.close()
+        except OSError:
+            pass
+
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, expire)
+    writer = threading.Thread(target=feed, daemon=True)
+
+    start = time.monotonic()
+    timer.start()
+    writer.start()
+
+    received = hashlib.sha256()
+    length = 0
+
+    while True:
+        chunk = proc.stdout.read(_block_size)
+        if not chunk:
+            break
+        received.update(chunk)
+        length += len(chunk)
+
+    proc.wait()
+    elapsed = time.monotonic() - start
+    timer.cancel()
+
+    if timed_out.is_set():
+        return None
+
+    return elapsed, length == size * _block_size and received.digest() == expected.digest()
+
+
+def separate_streams(commandline):
+    """Determine whether standard output and standard error are kept apart."""
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        subprocess.run(commandline + ['sh', '-c', 'echo out; echo err >&2'],
+                       stdin=subprocess.DEVNULL, stdout=out, stderr=err, timeout=60)
+
+        out.seek(0)
+        err.seek(0)
+
+        return out.read().strip() == b'out' and err.read().strip() == b'err'
+
+
+def entrypoint():
+    """Entrypoint."""
+    arguments = parse_command_line()
+
+    if arguments.simulate:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import simbottle
+
+        simbottle.enter()
+        simbottle.setup(os.path.abspath(arguments.genie))
+
+        genie = simbottle.genie_command([])
+
+        subprocess.run(genie + ['-i'], stdout=subprocess.DEVNULL, check=True)
+    else:
+        genie = [arguments.genie]
+
+    try:
+        print(f"{'mode':12} {'time':>10} {'throughput':>14}  {'intact':7} separate streams")
+
+        for name in arguments.mode or list(modes):
+            commandline = genie + modes[name] + ['-c']
+
+            result = stream(commandline + ['cat'], arguments.size, arguments.timeout)
+            separate = 'yes' if separate_streams(commandline) else 'no'
+
+            if result is None:
+                print(f"{name:12} {'timed out':>10} {'-':>14}  {'-':7} {separate}")
+                continue
+
+            elapsed, intact = result
+            print(f"{name:12} {elapsed:8.2f} s {arguments.size / elapsed:9.1f} MiB/s  "
+                  f"{'yes' if intact else 'NO':7} {separate}")
+    finally:
+        if arguments.simulate:
+            subprocess.run(genie + ['-u'], stdout=subprocess.DEVNULL)
+            simbottle.reap()
+
+
+entrypoint()
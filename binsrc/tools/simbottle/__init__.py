@@ -0,0 +1,243 @@
+# Simulated bottle module
+#
+# A stand-in for a WSL 2 host with a bottle, for the benchmark and stress tools.
+# Runs inside unprivileged user, mount, pid and UTS namespaces, with scratch
+# /run, /etc (an overlay on the real one) and /usr/lib/binfmt.d, a faked
+# /run/WSL, and fake systemd, systemctl, machinectl, systemd-run and daemonize
+# programs ahead of the real ones on the path. Nothing genie does inside the
+# sandbox touches the host.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Global variables
+
+# Directory holding the simulated bottle's configuration and state.
+state_dir = '/run/simbottle'
+config_file = '/run/simbottle/config.json'
+state_file = '/run/simbottle/state'
+init_log = '/run/simbottle/init.log'
+
+# Fake programs, shipped alongside this module as <name>.py.
+fakes = ['systemd', 'systemctl', 'machinectl', 'systemd-run', 'daemonize']
+
+# The path inside the sandbox: the fakes, then the usual system directories
+# (so that nothing installed for the user shadows util-linux).
+system_path = '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+
+_source_dir = os.path.dirname(os.path.abspath(__file__))
+_sandbox_marker = 'SIMBOTTLE_SANDBOX'
+
+scratch = None
+bin_dir = None
+
+
+# functions
+def enter():
+    """Re-execute the calling tool inside the sandbox's namespaces, unless already there."""
+    if os.environ.get(_sandbox_marker) == '1':
+        return
+
+    unshare = shutil.which('unshare')
+    if unshare is None:
+        sys.exit("simbottle: the unshare utility (util-linux) is required")
+
+    env = os.environ.copy()
+    env[_sandbox_marker] = '1'
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    os.execve(unshare,
+              [unshare, '--user', '--map-root-user', '--mount', '--pid', '--uts',
+               '--fork', '--mount-proc', '--', sys.executable] + sys.argv,
+              env)
+
+
+def setup(genie, boot_delay=0.0, shutdown_delay=0.0, bus=True, failed_units=0, settings=None):
+    """Build the simulated host inside the sandbox; genie is the zipapp or source directory to run."""
+    global scratch
+    global bin_dir
+
+    if os.environ.get(_sandbox_marker) != '1' or os.getpid() != 1:
+        sys.exit("simbottle: setup must be called after enter()")
+
+    genie = os.path.abspath(genie)
+
+    # All scratch state lives in a tmpfs, so it vanishes along with the sandbox.
+    scratch = tempfile.mkdtemp(prefix='simbottle.')
+    _mount(['-t', 'tmpfs', 'tmpfs', scratch])
+
+    bin_dir = os.path.join(scratch, 'bin')
+    os.mkdir(bin_dir)
+
+    for name in ['upper', 'work']:
+        os.mkdir(os.path.join(scratch, name))
+
+    _mount(['-t', 'overlay', 'overlay', '-o',
+            f'lowerdir=/etc,upperdir={scratch}/upper,workdir={scratch}/work', '/etc'])
+
+    _mount(['-t', 'tmpfs', 'tmpfs', '/run'])
+
+    if os.path.isdir('/usr/lib/binfmt.d'):
+        _mount(['-t', 'tmpfs', 'tmpfs', '/usr/lib/binfmt.d'])
+
+    # Give genie a binfmt_misc to unmount, if this kernel lets us.
+    subprocess.run(['mount', '-t', 'binfmt_misc', 'binfmt_misc', '/proc/sys/fs/binfmt_misc'],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # Pretend to be WSL 2.
+    os.mkdir('/run/WSL')
+    subprocess.run(['hostname', 'simbottle'], check=True)
+
+    with open('/etc/hostname', 'w') as hostfile:
+        print('simbottle', file=hostfile)
+
+    with open('/etc/hosts', 'w') as hostsfile:
+        print("# Scratch hosts file for the simulated bottle", file=hostsfile)
+        print("127.0.0.1\tlocalhost", file=hostsfile)
+        print("127.0.1.1\tsimbottle.localdomain\tsimbottle", file=hostsfile)
+        print("", file=hostsfile)
+        print("# The following lines are desirable for IPv6 capable hosts", file=hostsfile)
+        print("::1\tip6-localhost\tip6-loopback", file=hostsfile)
+
+    # Fake programs, and a genie which runs the one under test.
+    for name in fakes:
+        with open(os.path.join(_source_dir, f'{name}.py'), 'r') as source:
+            _write_program(name, f'#! {sys.executable}\n' + source.read())
+
+    _write_program('genie', f'#! /bin/sh\nexec {sys.executable} {genie} "$@"\n')
+
+    # Configuration for genie.
+    options = {'secure-path': f"{bin_dir}:{system_path}",
+               'target-warning': 'false'}
+    options.update(settings or {})
+
+    write_genie_ini(options)
+
+    # Host facts which cannot be probed from inside the sandbox.
+    with open('/proc/sys/kernel/random/boot_id', 'r') as bootfile:
+        boot_id = bootfile.read().strip()
+
+    with open('/run/genie.facts', 'w') as factsfile:
+        json.dump({'boot-id': boot_id, 'apparmor': False}, factsfile)
+
+    # Configuration for the fake systemd.
+    os.mkdir(state_dir)
+    configure(genie=genie, boot_delay=boot_delay, shutdown_delay=shutdown_delay,
+              bus=bus, failed_units=failed_units)
+
+    os.environ['PATH'] = f"{bin_dir}:{system_path}"
+    os.environ['GENIE_LOGNAME'] = 'root'
+
+
+def configure(**settings):
+    """Update the fake systemd's configuration; takes effect the next time it boots."""
+    config = {}
+
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as configfile:
+            config = json.load(configfile)
+
+    config.update(settings)
+
+    with open(config_file, 'w') as configfile:
+        json.dump(config, configfile)
+
+
+def write_genie_ini(options):
+    """Write /etc/genie.ini with the specified [genie] options."""
+    with open('/etc/genie.ini', 'w') as inifile:
+        print("[genie]", file=inifile)
+
+        for key, value in options.items():
+            print(f"{key}={value}", file=inifile)
+
+
+def genie_command(args):
+    """Get the command line which runs genie with args."""
+    return [os.path.join(bin_dir, 'genie')] + args
+
+
+def init_count():
+    """Get the number of times the fake systemd has been started."""
+    try:
+        with open(init_log, 'r') as logfile:
+            return len(logfile.readlines())
+    except OSError:
+        return 0
+
+
+def last_pid():
+    """Get the most recently allocated pid (or tid) in the sandbox's pid namespace."""
+    with open('/proc/loadavg', 'r') as loadfile:
+        return int(loadfile.read().split()[-1])
+
+
+def reap():
+    """Reap any orphans (e.g. daemonized unshare processes) which have been reparented to us."""
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+
+        if pid == 0:
+            return
+
+
+def wait_for_shutdown(timeout=30):
+    """Wait for any running simulated systemd to exit, so that the next run starts cold."""
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        reap()
+
+        running = False
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/comm', 'r') as commfile:
+                    if commfile.read().strip() == 'systemd':
+                        running = True
+                        break
+            except OSError:
+                continue
+
+        if not running:
+            return True
+
+        time.sleep(0.05)
+
+    return False
+
+
+def leftovers():
+    """List genie's runtime files which exist in /run."""
+    return sorted(name for name in os.listdir('/run') if name.startswith('genie.'))
+
+
+# Internal functions
+def _mount(args):
+    """Mount a filesystem, or exit explaining why the sandbox cannot be built."""
+    sp = subprocess.run(['mount'] + args, stderr=subprocess.PIPE, text=True)
+
+    if sp.returncode != 0:
+        sys.exit(f"simbottle: cannot mount {args[-1]} ({sp.stderr.strip()}); "
+                 "unprivileged user namespaces and overlayfs (Linux 5.11+) are required")
+
+
+def _write_program(name, text):
+    """Write an executable program into the sandbox's bin directory."""
+    path = os.path.join(bin_dir, name)
+
+    with open(path, 'w') as progfile:
+        progfile.write(text)
+
+    os.chmod(path, 0o755)
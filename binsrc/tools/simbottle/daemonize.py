@@ -0,0 +1,39 @@
+# Fake daemonize for the simulated bottle
+#
+# daemonize PATH [ARGS...]: runs PATH fully detached (double fork, new session,
+# standard streams on /dev/null), and exits as soon as it has started.
+
+import os
+import sys
+
+
+def main():
+    """Do as daemonize would, without its options."""
+    if len(sys.argv) < 2 or sys.argv[1].startswith('-'):
+        sys.exit("daemonize (simulated): usage: daemonize path [args...]")
+
+    pid = os.fork()
+
+    if pid != 0:
+        os.waitpid(pid, 0)
+        sys.exit(0)
+
+    os.setsid()
+
+    if os.fork() != 0:
+        os._exit(0)
+
+    os.chdir('/')
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    try:
+        os.execv(sys.argv[1], sys.argv[1:])
+    finally:
+        os._exit(127)
+
+
+main()
@@ -0,0 +1,45 @@
+# Fake machinectl for the simulated bottle
+#
+# machinectl shell [-q] USER@.host [COMMAND...] runs the command (or a shell)
+# directly, without a session; if the command is genie's runinwsl helper, does
+# what it would (change directory, then run the rest).
+
+import os
+import sys
+
+runinwsl = '/usr/lib/genie/runinwsl'
+
+
+def main():
+    """Do as machinectl shell would, more or less."""
+    args = sys.argv[1:]
+
+    if not args or args[0] != 'shell':
+        sys.exit(f"machinectl (simulated): '{' '.join(args)}' is not simulated")
+
+    args = [a for a in args[1:] if a not in ('-q', '--quiet')]
+
+    # Drop the USER@.host target.
+    if args and '@' in args[0]:
+        args = args[1:]
+
+    if not args:
+        args = [os.environ.get('SHELL', '/bin/sh')]
+
+    if args[0] == runinwsl:
+        if len(args) < 3:
+            sys.exit("runinwsl (simulated): no working directory or command specified")
+
+        os.chdir(args[1])
+        args = args[2:]
+
+    sys.stdout.flush()
+
+    try:
+        os.execvp(args[0], args)
+    except OSError as e:
+        print(f"machinectl (simulated): cannot run '{args[0]}': {e.strerror}", file=sys.stderr)
+        sys.exit(127)
+
+
+main()
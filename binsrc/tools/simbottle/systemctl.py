@@ -0,0 +1,50 @@
+# Fake systemctl for the simulated bottle
+#
+# Supports only what genie runs inside the bottle: is-system-running, --failed
+# and poweroff.
+
+import os
+import signal
+import sys
+
+state_file = '/run/simbottle/state'
+
+
+def get_state():
+    """Get the simulated system state."""
+    try:
+        with open(state_file, 'r') as statefile:
+            return statefile.read().strip()
+    except OSError:
+        return 'offline'
+
+
+def main():
+    """Do as systemctl would, more or less."""
+    args = [a for a in sys.argv[1:] if a not in ('-q', '--quiet', '--no-pager')]
+
+    if args == ['is-system-running']:
+        state = get_state()
+        print(state)
+        sys.exit(0 if state == 'running' else 1)
+
+    if args == ['--failed']:
+        print("0 loaded units listed.")
+        sys.exit(0)
+
+    if args == ['poweroff']:
+        # Only ever signal the simulated systemd, never whatever else is pid 1 here.
+        # (/proc may be that of the sandbox, whose pid 1 is not ours.)
+        with open('/proc/1/comm', 'r') as commfile:
+            ours = commfile.read().strip() == 'systemd'
+
+        if not ours and os.readlink('/proc/self/ns/pid') == os.readlink('/proc/1/ns/pid'):
+            sys.exit("systemctl (simulated): not inside the simulated bottle")
+
+        os.kill(1, signal.SIGRTMIN + 4)
+        sys.exit(0)
+
+    sys.exit(f"systemctl (simulated): '{' '.join(sys.argv[1:])}' is not simulated")
+
+
+main()
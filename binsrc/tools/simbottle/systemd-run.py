@@ -0,0 +1,48 @@
+# Fake systemd-run for the simulated bottle
+#
+# systemd-run [OPTIONS...] COMMAND... runs the command directly, with the
+# caller's standard streams, without a unit or session (as with --scope or
+# --pipe); if the command is genie's runinwsl helper, does what it would
+# (change directory, then run the rest).
+
+import os
+import sys
+
+runinwsl = '/usr/lib/genie/runinwsl'
+
+# Options which take a separate value, when not given as --option=value.
+valued_options = ['-p', '--property', '--uid', '--gid', '-E', '--setenv', '-u', '--unit',
+                  '--description', '--slice', '--service-type', '-M', '--machine']
+
+
+def main():
+    """Do as systemd-run would, more or less."""
+    args = sys.argv[1:]
+
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+
+        if option == '--':
+            break
+
+        if option in valued_options and args:
+            args.pop(0)
+
+    if not args:
+        sys.exit("systemd-run (simulated): no command specified")
+
+    if args[0] == runinwsl:
+        if len(args) < 3:
+            sys.exit("runinwsl (simulated): no working directory or command specified")
+
+        os.chdir(args[1])
+        args = args[2:]
+
+    try:
+        os.execvp(args[0], args)
+    except OSError as e:
+        print(f"systemd-run (simulated): cannot run '{args[0]}': {e.strerror}", file=sys.stderr)
+        sys.exit(127)
+
+
+main()
@@ -0,0 +1,280 @@
+# Fake systemd for the simulated bottle
+#
+# Runs as pid 1 of the bottle's pid namespace. Boots (i.e., waits) for the
+# configured delay, reports readiness on $NOTIFY_SOCKET, and answers
+# org.freedesktop.DBus.Properties.Get and GetAll for the manager's properties,
+# and the manager's ListUnits, on /run/systemd/private, just as far as genie
+# needs. Powers off (after the
+# configured delay) on SIGRTMIN+4 or SIGTERM.
+
+import fcntl
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+config_file = '/run/simbottle/config.json'
+state_file = '/run/simbottle/state'
+init_log = '/run/simbottle/init.log'
+error_log = '/run/simbottle/systemd.log'
+
+# Our standard streams are /dev/null; keep any tracebacks somewhere visible.
+os.dup2(os.open(error_log, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644), 2)
+
+with open(config_file, 'r') as configfile:
+    config = json.load(configfile)
+
+# genie's own bus module does the marshalling.
+sys.path.insert(0, config['genie'])
+import busclient  # noqa: E402
+
+state = 'starting'
+
+# When we started and finished booting, in microseconds of CLOCK_MONOTONIC.
+userspace_timestamp = int(time.monotonic() * 1000000)
+finish_timestamp = 0
+
+
+def set_state(new_state):
+    """Record the system state, for the fake systemctl."""
+    global state
+
+    state = new_state
+
+    with open(state_file + '.new', 'w') as statefile:
+        print(state, file=statefile)
+
+    os.replace(state_file + '.new', state_file)
+
+
+def notify_ready():
+    """Tell whoever started us that we have finished booting."""
+    path = os.environ.get('NOTIFY_SOCKET')
+
+    if not path:
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    try:
+        sock.sendto(f'READY=1\nSTATUS=Simulated bottle {state}'.encode(), path)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def manager_property(name):
+    """Get a manager property, as a (signature, value) variant, or None if unknown."""
+    if name == 'SystemState':
+        return ('s', state)
+
+    if name == 'NFailedUnits':
+        return ('u', config.get('failed_units', 0))
+
+    if name == 'UserspaceTimestampMonotonic':
+        return ('t', userspace_timestamp)
+
+    if name == 'FinishTimestampMonotonic':
+        return ('t', finish_timestamp)
+
+    return None
+
+
+def manager_properties():
+    """Get all the simulated manager properties, as a dict of variants."""
+    names = ['SystemState', 'NFailedUnits', 'UserspaceTimestampMonotonic', 'FinishTimestampMonotonic']
+
+    return {name: manager_property(name) for name in names}
+
+
+def units():
+    """List the simulated units, as ListUnits would: init.scope, and any failed units."""
+    def unit(name, active_state, sub_state):
+        return (name, '', 'loaded', active_state, sub_state, '', '/org/freedesktop/systemd1/unit/' + name.replace('.', '_2e'),
+                0, '', '/')
+
+    return [unit('init.scope', 'active', 'running')] + \
+        [unit(f'simulated-failure-{n}.service', 'failed', 'failed') for n in range(config.get('failed_units', 0))]
+
+
+def read_line(conn):
+    """Read one CRLF-terminated line of the authentication protocol."""
+    line = bytearray()
+
+    while not line.endswith(b'\r\n'):
+        chunk = conn.recv(1)
+        if not chunk:
+            raise EOFError()
+        line += chunk
+
+    return bytes(line).strip(b'\0\r\n')
+
+
+def receive(conn):
+    """Receive one message; returns its serial, header fields and body."""
+    fixed = busclient._recv_exactly(conn, 16)
+
+    endian = '<' if fixed[0:1] == b'l' else '>'
+    body_length, serial, fields_length = struct.unpack(endian + 'III', fixed[4:16])
+
+    header_length = 16 + fields_length
+    header_length += -header_length % 8
+
+    data = fixed + busclient._recv_exactly(conn, header_length - 16 + body_length)
+
+    header_fields, _ = busclient._unmarshal(data, 12, 'a(yv)', endian)
+    headers = {code: value for code, (_, value) in header_fields[0]}
+
+    body = []
+    if busclient._SIGNATURE in headers:
+        body, _ = busclient._unmarshal(data[header_length:], 0, headers[busclient._SIGNATURE], endian)
+
+    return serial, headers, body
+
+
+def reply(conn, serial, signature, values, error=None):
+    """Send a method return (or error) for the message with the specified serial."""
+    fields = [(busclient._REPLY_SERIAL, ('u', serial)),
+              (busclient._SIGNATURE, ('g', signature))]
+
+    msg_type = busclient._METHOD_RETURN
+
+    if error is not None:
+        fields.append((busclient._ERROR_NAME, ('s', error)))
+        msg_type = busclient._ERROR
+
+    busclient._send(conn, msg_type, fields, signature, values)
+
+
+def serve_bus(conn):
+    """Serve one bus connection (in a thread of its own)."""
+    try:
+        while True:
+            line = read_line(conn)
+
+            if line.startswith(b'AUTH'):
+                conn.sendall(b'OK 0123456789abcdef0123456789abcdef\r\n')
+            elif line == b'BEGIN':
+                break
+            else:
+                conn.sendall(b'ERROR\r\n')
+
+        while True:
+            serial, headers, body = receive(conn)
+
+            member = headers.get(busclient._MEMBER)
+
+            if member == 'Get' and len(body) == 2:
+                value = manager_property(body[1])
+
+                if value is not None:
+                    reply(conn, serial, 'v', [value])
+                    continue
+
+            if member == 'GetAll':
+                reply(conn, serial, 'a{sv}', [manager_properties()])
+                continue
+
+            if member == 'ListUnits':
+                reply(conn, serial, 'a(ssssssouso)', [units()])
+                continue
+
+            reply(conn, serial, 's', ['not simulated'],
+                  error='org.freedesktop.DBus.Error.UnknownMethod')
+    except (EOFError, OSError, busclient.BusError):
+        pass
+    finally:
+        conn.close()
+
+
+def main():
+    """Boot, serve, and power off."""
+    global finish_timestamp
+
+    if os.getpid() != 1:
+        sys.exit("systemd (simulated): must run as pid 1 of a pid namespace")
+
+    with open(init_log, 'a') as logfile:
+        print(f"{time.time():.6f}", file=logfile)
+
+    set_state('starting')
+
+    # Wake the main loop on signals.
+    wake_r, wake_w = os.pipe()
+    fcntl.fcntl(wake_w, fcntl.F_SETFL, os.O_NONBLOCK)
+    signal.set_wakeup_fd(wake_w)
+
+    stop_at = None
+
+    def poweroff(signum, frame):
+        nonlocal stop_at
+
+        if stop_at is None:
+            set_state('stopping')
+            stop_at = time.monotonic() + config.get('shutdown_delay', 0)
+
+    signal.signal(signal.SIGRTMIN + 4, poweroff)
+    signal.signal(signal.SIGTERM, poweroff)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    listener = None
+
+    if config.get('bus', True):
+        os.makedirs('/run/systemd', exist_ok=True)
+        if os.path.lexists(busclient.private_socket_path):
+            os.remove(busclient.private_socket_path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(busclient.private_socket_path)
+        listener.listen(64)
+
+    boot_at = time.monotonic() + config.get('boot_delay', 0)
+
+    while True:
+        now = time.monotonic()
+
+        if state == 'starting' and now >= boot_at:
+            finish_timestamp = int(now * 1000000)
+            set_state('degraded' if config.get('failed_units', 0) else 'running')
+            notify_ready()
+
+        if stop_at is not None and now >= stop_at:
+            break
+
+        timeout = None
+        if state == 'starting':
+            timeout = max(0, boot_at - now)
+        elif stop_at is not None:
+            timeout = max(0, stop_at - now)
+
+        watch = [wake_r] + ([listener] if listener is not None else [])
+        readable, _, _ = select.select(watch, [], [], timeout)
+
+        if wake_r in readable:
+            os.read(wake_r, 256)
+
+        if listener in readable:
+            conn, _ = listener.accept()
+            threading.Thread(target=serve_bus, args=(conn,), daemon=True).start()
+
+        # We are init; reap whatever is reparented to us.
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0] != 0:
+                pass
+        except ChildProcessError:
+            pass
+
+    if listener is not None:
+        listener.close()
+        os.remove(busclient.private_socket_path)
+
+    os.remove(state_file)
+
+
+main()
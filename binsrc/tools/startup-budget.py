@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+#
+# Check genie's per-command startup cost against a budget.
+#
+# For each command, runs genie under python3 -X importtime, and checks both the
+# time spent importing modules (over and above that of a bare interpreter) and
+# that no module reserved for other commands was imported. Runs genie against a
+# simulated bottle (see simbottle), so that it gets past its prelaunch checks,
+# first with the bottle stopped and then with it running, e.g.:
+#
+#   python3 tools/startup-budget.py out/genie
+#
+# Needs no privileges, and no WSL.
+
+import argparse
+import os
+import subprocess
+import sys
+
+import simbottle
+
+# Per-command budget: maximum import time in milliseconds over that of a bare
+# interpreter, and modules which the command must not import.
+budgets = [
+    (['-V'], 30, ['psutil', 'namespaces', 'subprocess', 'socket', 'busclient']),
+    (['-b'], 30, ['psutil', 'namespaces', 'subprocess', 'busclient']),
+    (['-r'], 40, ['psutil', 'namespaces', 'concurrent', 'broker']),
+    (['--status'], 40, ['psutil', 'namespaces', 'concurrent']),
+]
+
+
+def parse_command_line():
+    """Create the command-line option parser and parse arguments."""
+    parser = argparse.ArgumentParser(
+        description="Check genie's per-command import time and imported modules against a budget.")
+
+    parser.add_argument('-n', '--iterations', type=int, default=5,
+                        help="number of runs per command; the fastest is used")
+    parser.add_argument('genie', nargs='?', default='out/genie',
+                        help="genie zipapp (or source directory) to check")
+
+    return parser.parse_args()
+
+
+def import_profile(commandline):
+    """Run commandline under -X importtime; returns total import time in ms and the set of modules imported."""
+    sp = subprocess.run(commandline, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                        stderr=subprocess.PIPE, text=True)
+
+    total = 0
+    modules = set()
+
+    for line in sp.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[12:].split('|')
+
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+
+        total += int(fields[0])
+        modules.add(fields[2].strip())
+
+    return total / 1000, modules
+
+
+def best_profile(commandline, iterations):
+    """Profile commandline several times; returns the fastest import time and the modules imported."""
+    best = None
+    modules = set()
+
+    for _ in range(iterations):
+        elapsed, modules = import_profile(commandline)
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, modules
+
+
+def entrypoint():
+    """Entrypoint."""
+    arguments = parse_command_line()
+
+    if not os.path.exists(arguments.genie):
+        sys.exit(f"startup-budget: {arguments.genie} not found; build it first")
+
+    genie = os.path.abspath(arguments.genie)
+
+    simbottle.enter()
+    simbottle.setup(genie)
+
+    python = [sys.executable, '-X', 'importtime']
+
+    bare, _ = best_profile(python + ['-c', 'pass'], arguments.iterations)
+    print(f"{'(bare)':26} {bare:7.1f} ms")
+
+    failed = False
+
+    try:
+        for state in ['stopped', 'running']:
+            if state == 'running':
+                subprocess.run(simbottle.genie_command(['-i']), stdout=subprocess.DEVNULL, check=True)
+
+            for args, budget, forbidden in budgets:
+                elapsed, modules = best_profile(python + [genie] + args, arguments.iterations)
+                over = elapsed - bare
+
+                problems = []
+
+                if over > budget:
+                    problems.append(f"over budget of {budget} ms")
+
+                imported = sorted(m for m in forbidden if m in modules)
+                if imported:
+                    problems.append("imports " + ', '.join(imported))
+
+                verdict = 'FAIL: ' + '; '.join(problems) if problems else 'ok'
+                print(f"{'genie ' + ' '.join(args) + f' ({state})':26} {elapsed:7.1f} ms (+{over:.1f})   {verdict}")
+
+                failed = failed or bool(problems)
+    finally:
+        subprocess.run(simbottle.genie_command(['-u']), stdout=subprocess.DEVNULL)
+        simbottle.wait_for_shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+entrypoint()
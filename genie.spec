@@ -42,7 +42,6 @@ echo %{buildroot}%{_mandir}
 install -d -p %{buildroot}%{_sysconfdir}
 install -d -p %{buildroot}%{_exec_prefix}/lib/%{name}
 install -d -p %{buildroot}%{_exec_prefix}/lib/systemd/system-environment-generators
-install -d -p %{buildroot}%{_exec_prefix}/lib/systemd/user-environment-generators
 install -d -p %{buildroot}%{_exec_prefix}/lib/tmpfiles.d
 install -d -p %{buildroot}%{_bindir}
 install -d -p %{buildroot}%{_unitdir}
@@ -59,7 +58,6 @@ rm -rf %{_exec_prefix}/lib/%{name}/*
 rm -f %{_unitdir}/user-runtime-dir@.service.d/override.conf
 rm -f %{_exec_prefix}/lib/tmpfiles.d/wslg.conf
 rm -f %{_exec_prefix}/lib/systemd/system-environment-generators/80-genie-envar.sh
-rm -f %{_exec_prefix}/lib/systemd/user-environment-generators/80-genie-envar.sh
 rm -f ${_mandir}/man8/genie.8.gz
 fi
 
@@ -74,7 +72,6 @@ rm -rf %{buildroot}
 %{_unitdir}/user-runtime-dir@.service.d/override.conf
 %{_exec_prefix}/lib/tmpfiles.d/wslg.conf
 %{_exec_prefix}/lib/systemd/system-environment-generators/80-genie-envar.sh
-%{_exec_prefix}/lib/systemd/user-environment-generators/80-genie-envar.sh
 %doc %{_mandir}/man8/genie.8.gz
 
 %changelog
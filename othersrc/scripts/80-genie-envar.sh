@@ -1,11 +1,6 @@
 #!/bin/sh
-if [ -e /run/genie.env ]
+# The environment is prepared, ready-made, by genie when the bottle is initialized.
+if [ -e /run/environment.d/80-genie.conf ]
 then
-  cat /run/genie.env
-fi
-
-if [ -e /run/genie.path ]
-then
-  PATH=$PATH:$(cat /run/genie.path)
-  echo PATH="$(echo $PATH | awk -v RS=: '!($0 in a) {a[$0]; printf("%s%s", length(a) > 1 ? ":" : "", $0)}')"
+  cat /run/environment.d/80-genie.conf
 fi